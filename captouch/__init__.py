@@ -0,0 +1,4 @@
+from .csrmap import CSRMap, Register
+from .etherbone import Etherbone
+from .touch import (TouchPads, Snapshot, Sample, TouchEvent, SliderState, sequence_delta, timestamp_delta,
+                    EV_TOUCH, EV_SWIPE, EV_TAP, EV_DTAP)
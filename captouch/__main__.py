@@ -0,0 +1,56 @@
+import argparse
+import sys
+
+from .etherbone import Etherbone
+from .touch import TouchPads
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor the Fomu captouch pads over Etherbone")
+    parser.add_argument(
+        "--csr-csv", default="build/csr.csv", help="csr.csv file describing the gateware"
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="address of the Etherbone server"
+    )
+    parser.add_argument(
+        "--port", default=1234, type=int, help="port of the Etherbone server"
+    )
+    parser.add_argument(
+        "--events", action="store_true", help="block until pads change rather than polling"
+    )
+    parser.add_argument(
+        "--libetherbone", action="store_true", help="talk to the bridge through client/libetherbone.so"
+    )
+    args = parser.parse_args()
+
+    if args.libetherbone:
+        from .libetherbone import LibEtherbone
+        bridge = LibEtherbone(args.host, args.port)
+    else:
+        bridge = Etherbone(args.host, args.port)
+
+    with bridge:
+        pads = TouchPads(bridge, args.csr_csv)
+        pads.ev_enable.write(0)
+        pads.capen.write((1 << pads.npads) - 1)
+
+        while args.events:
+            event = pads.wait_event()
+            sys.stderr.write("Status: {:02x}  Pressed: {:02x}  Released: {:02x}   STATE: {}\n".format(
+                event.cstat, event.pressed, event.released,
+                " ".join("x" if event.cstat & (1 << n) else " " for n in range(pads.npads))))
+
+        while True:
+            snap = pads.snapshot()
+            line = "\r"
+            if snap.counts is not None:
+                line += " ".join("{:02x}".format(c) for c in snap.counts) + "  "
+            line += "EV_PEND: {:02x}  Status: {:02x}  In: {:02x} / {:02x} / {:02x}".format(
+                snap.ev_pending, snap.cstat, snap.i, snap.o, snap.oe)
+            if snap.ev_pending:
+                pads.ev_pending.write(snap.ev_pending)
+                line += "   STATE: " + " ".join("x" if p else " " for p in snap.pressed) + "\n"
+            sys.stderr.write(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import socket
+import time
+
+from .csrmap import register_addrs, combine_registers
+from .etherbone import (encode_reads, encode_writes, chunks, decode_reply, reply_count,
+                        reply_length, MAX_RECORD_COUNT)
+from .touch import (TouchPads, decode_event, decode_sample, decode_pair_deltas,
+                    decode_slider)
+
+TimedSnapshot = collections.namedtuple("TimedSnapshot", ["timestamp", "snapshot"])
+
+class AsyncEtherbone:
+    """Pipelined asyncio Etherbone connection.
+
+    Requests are written as soon as they are issued, and up to `max_in_flight`
+    read packets may be outstanding at once.  The bridge answers packets in
+    order, so replies are matched to requests by their position in the queue.
+    """
+    def __init__(self, reader, writer, max_in_flight=16):
+        self.reader = reader
+        self.writer = writer
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.pending = collections.deque()
+        # Set once the connection can no longer answer requests
+        self.error = None
+        self.receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=1234, max_in_flight=16):
+        reader, writer = await asyncio.open_connection(host, port)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(reader, writer, max_in_flight=max_in_flight)
+
+    async def close(self):
+        if self.error is None:
+            self.error = ConnectionError("etherbone connection closed")
+        self.receiver.cancel()
+        self.writer.close()
+        for future in self.pending:
+            if not future.done():
+                future.cancel()
+        self.pending.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _receive(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(reply_length(0))
+                body = await self.reader.readexactly(4 * reply_count(header))
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_result(decode_reply(header + body))
+        except asyncio.IncompleteReadError:
+            error = ConnectionError("etherbone connection closed")
+        except Exception as e:
+            error = e
+        self.error = error
+        # Fail every request that will now never be answered
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_packet(self, addrs):
+        async with self.in_flight:
+            if self.error is not None:
+                raise self.error
+            future = asyncio.get_event_loop().create_future()
+            self.pending.append(future)
+            self.writer.write(encode_reads(addrs))
+            await self.writer.drain()
+            return await future
+
+    async def read(self, addr):
+        return (await self.read_many([addr]))[0]
+
+    async def write(self, addr, value):
+        await self.write_many(addr, [value])
+
+    async def read_many(self, addrs):
+        results = await asyncio.gather(*[self._read_packet(batch) for batch in chunks(list(addrs))])
+        values = []
+        for result in results:
+            values += result
+        return values
+
+    async def write_many(self, addr, values):
+        for i, batch in enumerate(chunks(list(values))):
+            self.writer.write(encode_writes(addr + 4 * i * MAX_RECORD_COUNT, batch))
+        await self.writer.drain()
+
+class AsyncRegisterAccessor:
+    def __init__(self, bridge, register):
+        self.bridge = bridge
+        self.register = register
+
+    async def read(self):
+        return self.register.combine(await self.bridge.read_many(self.register.addrs))
+
+    async def write(self, value):
+        if not self.register.writable:
+            raise ValueError("register {} is read-only".format(self.register.name))
+        await self.bridge.write_many(self.register.addr, self.register.split(value))
+
+class AsyncTouchPads(TouchPads):
+    """asyncio version of `TouchPads`.  Register accessors return coroutines."""
+    accessor = AsyncRegisterAccessor
+
+    async def read_registers(self, registers):
+        return combine_registers(registers, await self.bridge.read_many(register_addrs(registers)))
+
+    async def snapshot(self):
+        return self.make_snapshot(await self.read_registers(self.snapshot_registers))
+
+    async def sample(self):
+        return decode_sample(await self.bridge.read_many(self.sample_addrs()), self.count_width, self.npads)
+
+    async def drain(self):
+        count = await self.fifo_level.read()
+        if not count:
+            return []
+        return self.decode_fifo(await self.bridge.read_many(self.fifo_addrs(count)))
+
+    async def slider_state(self):
+        return decode_slider(await self.slider.read())
+
+    async def pair_deltas(self):
+        layout = self.pair_layout()
+        return decode_pair_deltas(await self.mdelta.read(), *layout)
+
+    async def wait_event(self, timeout=None):
+        addrs = self.event_addrs()
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            event = decode_event(await self.bridge.read_many(addrs), self.npads)
+            if event is not None:
+                return event
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    async def stream(self, interval=None, depth=4):
+        """Yield a `TimedSnapshot` for every sample.
+
+        Up to `depth` snapshot reads are kept in flight so the bridge latency
+        is hidden.  New reads are only issued as the consumer takes results,
+        so a slow consumer throttles the bridge rather than queueing without
+        bound.  If `interval` is given, reads are issued at most once per
+        `interval` seconds.  Each timestamp is taken as the reply arrives,
+        not when the consumer gets to it.
+        """
+        async def timed_snapshot():
+            snapshot = await self.snapshot()
+            return TimedSnapshot(time.time(), snapshot)
+
+        loop = asyncio.get_event_loop()
+        in_flight = collections.deque()
+        next_issue = loop.time()
+        try:
+            while True:
+                while len(in_flight) < depth:
+                    if interval is not None:
+                        delay = next_issue - loop.time()
+                        if delay > 0 and in_flight:
+                            break
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        next_issue = max(next_issue, loop.time()) + interval
+                    in_flight.append(asyncio.ensure_future(timed_snapshot()))
+                yield await in_flight.popleft()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+async def merge_streams(streams, maxsize=64):
+    """Interleave several `stream()` generators, yielding `(key, TimedSnapshot)`
+    tuples as results arrive.
+
+    `streams` maps a key, such as a board name, to an async iterator.  Results
+    pass through a queue of at most `maxsize` entries, so a slow consumer
+    stalls the producers instead of buffering without limit.  If any stream
+    raises, the exception is re-raised here.
+    """
+    queue = asyncio.Queue(maxsize=maxsize)
+    finished = object()
+
+    async def pump(key, stream):
+        try:
+            async for item in stream:
+                await queue.put((key, item, None))
+        except Exception as e:
+            await queue.put((key, None, e))
+        else:
+            await queue.put((key, finished, None))
+
+    tasks = [asyncio.ensure_future(pump(key, stream)) for key, stream in streams.items()]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            key, item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is finished:
+                remaining -= 1
+                continue
+            yield key, item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,98 @@
+import csv
+from collections import namedtuple
+
+class Register(namedtuple("Register", ["name", "addr", "size", "mode", "data_width"])):
+    """A single CSR as described by `csr.csv`
+
+    `size` is the number of bus words the register occupies.  LiteX places
+    the most significant word at the lowest address, with words spaced four
+    bytes apart.
+    """
+    __slots__ = ()
+
+    @property
+    def addrs(self):
+        return [self.addr + 4 * i for i in range(self.size)]
+
+    @property
+    def writable(self):
+        return self.mode == "rw"
+
+    def combine(self, words):
+        value = 0
+        mask = (1 << self.data_width) - 1
+        for word in words:
+            value = (value << self.data_width) | (word & mask)
+        return value
+
+    def split(self, value):
+        mask = (1 << self.data_width) - 1
+        return [(value >> (self.data_width * (self.size - 1 - i))) & mask for i in range(self.size)]
+
+class CSRMap:
+    """Register map loaded from the `csr.csv` written by `Builder`"""
+    def __init__(self, bases, registers, constants, regions):
+        self.bases = bases
+        self.registers = registers
+        self.constants = constants
+        self.regions = regions
+
+    @classmethod
+    def from_csv(cls, filename):
+        bases = {}
+        rows = []
+        constants = {}
+        regions = {}
+        with open(filename, "r", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or row[0].startswith("#"):
+                    continue
+                kind, name, value = row[0], row[1], row[2]
+                if kind == "csr_base":
+                    bases[name] = int(value, 0)
+                elif kind == "csr_register":
+                    rows.append((name, int(value, 0), int(row[3]), row[4] if len(row) > 4 else "rw"))
+                elif kind == "constant":
+                    constants[name] = _parse_constant(value)
+                elif kind == "memory_region":
+                    regions[name] = (int(value, 0), int(row[3], 0))
+
+        data_width = constants.get("csr_data_width", constants.get("config_csr_data_width", 8))
+        registers = {}
+        for name, addr, size, mode in rows:
+            registers[name] = Register(name, addr, size, mode, data_width)
+        return cls(bases, registers, constants, regions)
+
+    def block(self, name):
+        """Return the registers belonging to CSR block `name`, keyed by their
+        name with the block prefix removed."""
+        prefix = name + "_"
+        return dict((reg.name[len(prefix):], reg) for reg in self.registers.values()
+                    if reg.name.startswith(prefix))
+
+    def region(self, name):
+        if name not in self.regions:
+            raise KeyError("memory region {} not found in csr map".format(name))
+        return self.regions[name]
+
+def register_addrs(registers):
+    """Return the bus addresses needed to read every register in `registers`."""
+    addrs = []
+    for register in registers:
+        addrs += register.addrs
+    return addrs
+
+def combine_registers(registers, words):
+    """Turn the words read from `register_addrs(registers)` back into one
+    value per register."""
+    values = []
+    for register in registers:
+        values.append(register.combine(words[:register.size]))
+        words = words[register.size:]
+    return values
+
+def _parse_constant(value):
+    try:
+        return int(value, 0)
+    except ValueError:
+        return value
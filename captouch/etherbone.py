@@ -0,0 +1,105 @@
+import socket
+import struct
+
+# A single Etherbone record can carry at most 255 reads or writes.
+MAX_RECORD_COUNT = 255
+
+_PACKET_HEADER = struct.pack(">HBBxxxx",
+    0x4e6f,     # Magic
+    0x10,       # Version 1, all other flags 0
+    0x44,       # Address is 32-bits, port is 32-bits
+)
+_RECORD_HEADER_LEN = 4
+_HEADER_LEN = len(_PACKET_HEADER) + _RECORD_HEADER_LEN
+
+def encode_reads(addrs):
+    """Build one Etherbone packet reading every address in `addrs`.
+
+    The reads are placed in a single record, so the remote end performs all
+    of them and returns every value in a single reply.
+    """
+    if not 0 < len(addrs) <= MAX_RECORD_COUNT:
+        raise ValueError("can read between 1 and {} addresses per packet".format(MAX_RECORD_COUNT))
+    return (_PACKET_HEADER
+        + struct.pack(">BBBBI", 0, 0x0f, 0, len(addrs), 0)
+        + struct.pack(">{}I".format(len(addrs)), *addrs))
+
+def encode_writes(addr, values):
+    """Build one Etherbone packet writing `values` to consecutive words
+    starting at `addr`."""
+    if not 0 < len(values) <= MAX_RECORD_COUNT:
+        raise ValueError("can write between 1 and {} words per packet".format(MAX_RECORD_COUNT))
+    return (_PACKET_HEADER
+        + struct.pack(">BBBBI", 0, 0x0f, len(values), 0, addr)
+        + struct.pack(">{}I".format(len(values)), *values))
+
+def reply_length(count):
+    """Length of the reply to a packet containing `count` reads."""
+    return _HEADER_LEN + 4 + 4 * count
+
+def reply_count(header):
+    """Number of values carried by a reply, given its first
+    `reply_length(0)` bytes."""
+    if len(header) < _HEADER_LEN + 4 or header[0:2] != b"\x4e\x6f":
+        raise ValueError("invalid etherbone reply")
+    return header[_HEADER_LEN - 2]
+
+def decode_reply(data):
+    """Return the values carried in the reply to a read packet."""
+    count = reply_count(data)
+    return list(struct.unpack_from(">{}I".format(count), data, _HEADER_LEN + 4))
+
+def chunks(items, size=MAX_RECORD_COUNT):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class Etherbone:
+    """Blocking Etherbone connection to `wishbone-tool -s wishbone` or
+    `bin/litex_server`"""
+    def __init__(self, host="127.0.0.1", port=1234):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _recv_exactly(self, length):
+        data = b""
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("etherbone connection closed")
+            data += chunk
+        return data
+
+    def read(self, addr):
+        return self.read_many([addr])[0]
+
+    def write(self, addr, value):
+        self.write_many(addr, [value])
+
+    def read_many(self, addrs):
+        """Read every address in `addrs`, returning the values in order.
+
+        Up to 255 addresses go out in a single packet.  Longer lists are
+        split, with every packet sent before the first reply is awaited.
+        """
+        batches = list(chunks(list(addrs)))
+        for batch in batches:
+            self.sock.sendall(encode_reads(batch))
+        values = []
+        for batch in batches:
+            values += decode_reply(self._recv_exactly(reply_length(len(batch))))
+        return values
+
+    def write_many(self, addr, values):
+        """Write `values` to consecutive words starting at `addr`."""
+        values = list(values)
+        for i, batch in enumerate(chunks(values)):
+            self.sock.sendall(encode_writes(addr + 4 * i * MAX_RECORD_COUNT, batch))
@@ -0,0 +1,88 @@
+import ctypes
+import os
+
+# Built by `make -C client libetherbone.so`
+DEFAULT_LIBRARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "client", "libetherbone.so")
+
+_library = None
+
+def load_library(path=None):
+    """Load `libetherbone.so` and declare its functions.
+
+    The library is looked for at `path`, then `$LIBETHERBONE`, then in the
+    `client/` directory next to this package.
+    """
+    global _library
+    if _library is not None and path is None:
+        return _library
+    lib = ctypes.CDLL(path or os.environ.get("LIBETHERBONE") or DEFAULT_LIBRARY)
+
+    lib.eb_connect.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+    lib.eb_connect.restype = ctypes.c_void_p
+    lib.eb_disconnect.argtypes = [ctypes.POINTER(ctypes.c_void_p)]
+    lib.eb_disconnect.restype = None
+    lib.eb_readv.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint32),
+                             ctypes.POINTER(ctypes.c_uint32), ctypes.c_size_t]
+    lib.eb_readv.restype = ctypes.c_int
+    lib.eb_writev.argtypes = [ctypes.c_void_p, ctypes.c_uint32,
+                              ctypes.POINTER(ctypes.c_uint32), ctypes.c_size_t]
+    lib.eb_writev.restype = ctypes.c_int
+
+    if path is None:
+        _library = lib
+    return lib
+
+class LibEtherbone:
+    """Etherbone connection made through the C client library.
+
+    This has the same interface as `Etherbone`, so either can be handed to
+    `TouchPads`.  `read_many()` and `write_many()` map onto `eb_readv()` and
+    `eb_writev()`, so a whole list of words costs a single round trip.  Set
+    `direct` to talk UDP straight to a board rather than TCP to a server.
+    """
+    def __init__(self, host="127.0.0.1", port=1234, direct=False, library=None):
+        self.lib = load_library(library)
+        self.conn = self.lib.eb_connect(host.encode(), str(port).encode(), int(direct))
+        if not self.conn:
+            raise ConnectionError("couldn't connect to etherbone server at {}:{}".format(host, port))
+
+    def close(self):
+        if self.conn:
+            conn = ctypes.c_void_p(self.conn)
+            self.lib.eb_disconnect(ctypes.byref(conn))
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, addr):
+        return self.read_many([addr])[0]
+
+    def write(self, addr, value):
+        self.write_many(addr, [value])
+
+    def read_many(self, addrs):
+        """Read every address in `addrs`, returning the values in order.
+
+        Lists longer than 255 addresses are split into several packets by
+        the library, all sent before the first reply is awaited.
+        """
+        addrs = list(addrs)
+        if not addrs:
+            return []
+        values = (ctypes.c_uint32 * len(addrs))()
+        if self.lib.eb_readv(self.conn, (ctypes.c_uint32 * len(addrs))(*addrs), values, len(addrs)):
+            raise ConnectionError("etherbone read failed")
+        return list(values)
+
+    def write_many(self, addr, values):
+        """Write `values` to consecutive words starting at `addr`."""
+        values = list(values)
+        if not values:
+            return
+        if self.lib.eb_writev(self.conn, addr, (ctypes.c_uint32 * len(values))(*values), len(values)):
+            raise ConnectionError("etherbone write failed")
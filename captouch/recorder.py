@@ -0,0 +1,278 @@
+"""Record pad samples to compact binary logs for long-running characterization.
+
+Each log is a NumPy ``.npy`` file holding a one-dimensional structured array
+with one fixed-size record per sample, so it can be opened with
+`numpy.load(path, mmap_mode="r")` or with `open_log()`.  NumPy is only needed
+to read the logs back.
+"""
+import argparse
+import ast
+import os
+import struct
+import sys
+import time
+
+from .etherbone import Etherbone
+from .touch import TouchPads, Sample, sequence_delta, timestamp_delta
+
+MAGIC = b"\x93NUMPY"
+# The header is padded to a fixed size so that it can be rewritten in place
+# with the number of records every time the log is flushed.
+HEADER_LEN = 256
+
+def _uint(bits):
+    for size, code in ((8, "B"), (16, "H"), (32, "I")):
+        if bits <= size:
+            return size // 8, code
+    raise ValueError("{} bits do not fit in a record field".format(bits))
+
+def record_dtype(npads, count_width):
+    """The NumPy dtype description of one record, as written to the header"""
+    cstat_size = _uint(npads)[0]
+    count_size = _uint(count_width)[0]
+    return [
+        ("host_time", "<f8"),
+        ("sequence", "<u2"),
+        ("timestamp", "<u4"),
+        ("cstat", "<u{}".format(cstat_size)),
+        ("counts", "<u{}".format(count_size), (npads,)),
+    ]
+
+def record_struct(npads, count_width):
+    """A `struct.Struct` that packs one record, laid out as `record_dtype()`"""
+    return struct.Struct("<dHI{}{}{}".format(_uint(npads)[1], npads, _uint(count_width)[1]))
+
+def encode_header(descr, count):
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(descr, count)
+    header = header.ljust(HEADER_LEN - len(MAGIC) - 4 - 1) + "\n"
+    return MAGIC + struct.pack("<BBH", 1, 0, len(header)) + header.encode("latin1")
+
+class SampleLog:
+    """A single log file that records are appended to.  An existing file is
+    never overwritten."""
+    def __init__(self, path, npads, count_width):
+        self.path = path
+        self.descr = record_dtype(npads, count_width)
+        self.record = record_struct(npads, count_width)
+        self.count = 0
+        self.created = time.time()
+        self.file = open(path, "xb")
+        self.file.write(encode_header(self.descr, 0))
+
+    @property
+    def size(self):
+        return HEADER_LEN + self.count * self.record.size
+
+    def write(self, data, count):
+        """Append `count` records that have already been packed into `data`"""
+        self.file.write(data)
+        self.count += count
+
+    def flush(self):
+        # Record the new length in the header, so that `numpy.load()` sees
+        # every record written so far.
+        self.file.seek(0)
+        self.file.write(encode_header(self.descr, self.count))
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class Recorder:
+    """Append samples to a series of logs in `directory`.
+
+    Records are packed as they arrive, and written out once `flush_records`
+    have been collected or `flush_seconds` have passed since the last write,
+    so that the disk is not touched for every sample.  A new log is started
+    once the current one reaches `max_bytes`, or is `max_seconds` old.
+    """
+    def __init__(self, directory, npads, count_width, prefix="captouch", max_bytes=256 << 20,
+                 max_seconds=None, flush_records=4096, flush_seconds=1.0):
+        self.directory = directory
+        self.npads = npads
+        self.count_width = count_width
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.record = record_struct(npads, count_width)
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.index = 0
+        self.log = None
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, host_time, sample):
+        """Add a `Sample`, read from the board at `host_time`"""
+        self.pending.append(self.record.pack(host_time, sample.sequence, sample.timestamp,
+                                             sample.cstat, *sample.counts))
+        if (len(self.pending) >= self.flush_records
+                or time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def path(self):
+        name = "{}-{}-{:04d}.npy".format(self.prefix, time.strftime("%Y%m%d-%H%M%S"), self.index)
+        return os.path.join(self.directory, name)
+
+    def rotate(self):
+        """Close the current log, and start a new one with the next sample"""
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        if self.log is not None and (self.log.size >= self.max_bytes or
+                (self.max_seconds is not None and time.time() - self.log.created >= self.max_seconds)):
+            self.rotate()
+        while self.log is None:
+            # A recorder restarted within the same second would pick the
+            # same names as the last one, so skip past any that exist.
+            path = self.path()
+            self.index += 1
+            try:
+                self.log = SampleLog(path, self.npads, self.count_width)
+            except FileExistsError:
+                pass
+        self.log.write(b"".join(self.pending), len(self.pending))
+        self.log.flush()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.rotate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def open_log(path):
+    """Memory-map a log as a NumPy structured array, without reading it in.
+
+    The number of records is taken from the size of the file rather than the
+    header, so that a log whose recorder was killed can still be read.  Any
+    record that was only partly written is ignored.
+    """
+    import numpy
+
+    with open(path, "rb") as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a sample log".format(path))
+        header_len = struct.unpack("<H", prefix[len(MAGIC) + 2:])[0]
+        header = ast.literal_eval(f.read(header_len).decode("latin1"))
+    offset = len(prefix) + header_len
+    dtype = numpy.dtype(header["descr"])
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        # Empty files cannot be memory-mapped
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+def log_paths(directory, prefix="captouch"):
+    """Every log in `directory` written with `prefix`, oldest first"""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(prefix + "-") and name.endswith(".npy"))
+    return [os.path.join(directory, name) for name in names]
+
+def record(pads, recorder, interval):
+    """Record samples from `pads` until interrupted.
+
+    If the gateware has the sample FIFO, it is drained every `interval`
+    seconds, so no sample is missed as long as the FIFO does not fill in
+    between.  Otherwise, if it has the `touch_data` window, the snapshot
+    slot is read every `interval` seconds, and periods that end between
+    reads are missed.  The newest sample of each read is given the time it
+    was read at, and any others are placed before it using their
+    timestamps.  A period that is read twice is only recorded once, and any
+    gap in the sequence numbers is reported on stderr.
+
+    Without the window, the count registers are read every `interval`
+    seconds, and each record has a sequence number and timestamp of ``0``.
+    """
+    if pads.data_base is not None and "fifo_level" in pads.registers:
+        read = pads.drain
+    elif pads.data_base is not None:
+        def read():
+            sample = pads.sample()
+            return [] if sample is None else [sample]
+    elif pads.has_counts:
+        def read():
+            snap = pads.snapshot()
+            return [Sample(0, 0, snap.counts, snap.cstat, None)]
+    else:
+        raise ValueError("gateware was built without the touch_data window or the count registers")
+    previous = None
+    dropped = 0
+    while True:
+        samples = read()
+        now = time.time()
+        for sample in samples:
+            if pads.data_base is None:
+                recorder.add(now, sample)
+                continue
+            if previous is not None:
+                delta = sequence_delta(previous.sequence, sample.sequence)
+                if delta == 0:
+                    continue
+                if delta > 1:
+                    dropped += delta - 1
+                    print("dropped {} sample periods before sequence {}, {} in total".format(
+                        delta - 1, sample.sequence, dropped), file=sys.stderr)
+            previous = sample
+            age = timestamp_delta(sample.timestamp, samples[-1].timestamp) / pads.clk_freq
+            recorder.add(now - age, sample)
+        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Record Fomu captouch samples to binary logs")
+    parser.add_argument(
+        "--csr-csv", default="build/csr.csv", help="csr.csv file describing the gateware"
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="address of the Etherbone server"
+    )
+    parser.add_argument(
+        "--port", default=1234, type=int, help="port of the Etherbone server"
+    )
+    parser.add_argument(
+        "--output-dir", default="captouch-logs", help="directory to write the logs into"
+    )
+    parser.add_argument(
+        "--prefix", default="captouch", help="start of the name of every log file"
+    )
+    parser.add_argument(
+        "--rotate-mb", default=256, type=float, help="start a new log once the current one is this large"
+    )
+    parser.add_argument(
+        "--rotate-minutes", type=float, help="start a new log once the current one is this old"
+    )
+    parser.add_argument(
+        "--flush-seconds", default=1.0, type=float, help="longest time samples are held before being written"
+    )
+    parser.add_argument(
+        "--interval", default=0.25, type=float, help="seconds between reads of the board"
+    )
+    args = parser.parse_args()
+
+    with Etherbone(args.host, args.port) as bridge:
+        pads = TouchPads(bridge, args.csr_csv)
+        pads.capen.write((1 << pads.npads) - 1)
+        max_seconds = None if args.rotate_minutes is None else 60 * args.rotate_minutes
+        with Recorder(args.output_dir, pads.npads, pads.count_width, prefix=args.prefix,
+                      max_bytes=int(args.rotate_mb * (1 << 20)), max_seconds=max_seconds,
+                      flush_seconds=args.flush_seconds) as recorder:
+            try:
+                record(pads, recorder, args.interval)
+            except KeyboardInterrupt:
+                pass
+
+if __name__ == "__main__":
+    main()
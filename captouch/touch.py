@@ -0,0 +1,296 @@
+import time
+from collections import namedtuple
+
+from .csrmap import CSRMap, register_addrs, combine_registers
+
+class Snapshot(namedtuple("Snapshot", ["counts", "ev_pending", "cstat", "i", "o", "oe"])):
+    """The state of every pad, as read in a single bridge round trip.
+
+    `counts` is a tuple of per-pad counts, or `None` if the gateware was
+    built without the debug count registers.  The remaining values are
+    bitmasks with bit 0 corresponding to pad 1.
+    """
+    __slots__ = ()
+
+    @property
+    def pressed(self):
+        # Without the counts there is no telling how many pads there are, so
+        # assume Fomu's four.
+        npads = 4 if self.counts is None else len(self.counts)
+        return tuple(bool(self.cstat & (1 << n)) for n in range(npads))
+
+class TouchEvent(namedtuple("TouchEvent", ["cstat", "changed", "pressed", "released"])):
+    """A press or release reported by the blocking event word.  Every value
+    is a bitmask with bit 0 corresponding to pad 1.
+
+    `pressed` and `released` are latched separately by the gateware, so a pad
+    that was pressed and released again between two reads appears in both.
+    """
+    __slots__ = ()
+
+class Sample(namedtuple("Sample", ["sequence", "timestamp", "counts", "cstat", "ev_pending"])):
+    """Every value from one sample period, as latched by the snapshot slot or
+    the sample FIFO.
+
+    `sequence` counts sample periods modulo 2**16, and `timestamp` is the
+    clock cycle on which the period ended, modulo 2**32.  `ev_pending` is
+    `None` for FIFO entries.
+    """
+    __slots__ = ()
+
+    @property
+    def pressed(self):
+        return tuple(bool(self.cstat & (1 << n)) for n in range(len(self.counts)))
+
+class SliderState(namedtuple("SliderState", ["position", "touched", "direction"])):
+    """The gesture decoder's view of the pads.
+
+    `position` is in half-pad steps from pad 1, and is only meaningful while
+    `touched` is set.  `direction` is that of the most recent swipe, with
+    ``1`` meaning towards the last pad.
+    """
+    __slots__ = ()
+
+def sequence_delta(previous, current):
+    """Number of sample periods between two sequence numbers.  ``1`` means
+    nothing was missed, ``0`` means the same period was read twice, and
+    anything larger is one more than the number of periods dropped."""
+    return (current - previous) & 0xffff
+
+def timestamp_delta(previous, current):
+    """Number of clock cycles between two timestamps"""
+    return (current - previous) & 0xffffffff
+
+# Offsets of the slots within the `touch_data` memory window
+FIFO_OFFSET = 0x00
+EVENT_OFFSET = 0x40
+SNAPSHOT_OFFSET = 0x80
+
+# Bits of `EV_PENDING`.  The gesture events are only present if the
+# gateware was built with the gesture decoder.
+EV_TOUCH = 0x1
+EV_SWIPE = 0x2
+EV_TAP = 0x4
+EV_DTAP = 0x8
+
+# Each slot is packed into as many words as it needs, with bit 31 of the
+# last word marking it as valid.
+def _slot_words(bits):
+    return (bits + 1 + 31) // 32
+
+def sample_words(count_width, npads=4):
+    """Number of words in the snapshot slot"""
+    return _slot_words(npads * (count_width + 1) + 52)
+
+def fifo_words(count_width, npads=4):
+    """Number of words in each FIFO entry"""
+    return _slot_words(npads * (count_width + 1) + 48)
+
+def event_words(npads=4):
+    """Number of words in the blocking event slot"""
+    return _slot_words(4 * npads)
+
+def _join(words):
+    value = 0
+    for i, word in enumerate(words):
+        value |= word << (32 * i)
+    return value
+
+def _unpack(words, count_width, npads):
+    value = _join(words)
+    mask = (1 << count_width) - 1
+    counts = tuple((value >> (count_width * n)) & mask for n in range(npads))
+    value >>= npads * count_width
+    return counts, value & ((1 << npads) - 1), value >> npads
+
+def decode_sample(words, count_width, npads=4):
+    """Decode the snapshot slot, returning `None` if no sample period has
+    completed yet."""
+    if not words[-1] & 0x80000000:
+        return None
+    counts, cstat, value = _unpack(words, count_width, npads)
+    return Sample((value >> 4) & 0xffff, (value >> 20) & 0xffffffff, counts, cstat, value & 0xf)
+
+def decode_fifo_entry(words, count_width, npads=4):
+    """Decode one FIFO entry, returning `None` if the FIFO was empty."""
+    if not words[-1] & 0x80000000:
+        return None
+    counts, cstat, value = _unpack(words, count_width, npads)
+    return Sample(value & 0xffff, (value >> 16) & 0xffffffff, counts, cstat, None)
+
+def decode_event(words, npads=4):
+    """Decode the blocking event slot, given as a single word or a list of
+    `event_words()` words.  Returns `None` if the read timed out.
+
+    A read that the bus itself timed out returns all ones, which is also
+    treated as a timeout rather than as every pad changing at once.
+    """
+    if isinstance(words, int):
+        words = [words]
+    if not words[-1] & 0x80000000 or all(word == 0xffffffff for word in words):
+        return None
+    value = _join(words)
+    mask = (1 << npads) - 1
+    return TouchEvent(*[(value >> (npads * n)) & mask for n in range(4)])
+
+def decode_pair_deltas(value, npairs, width):
+    """Split the `MDELTA` register into one signed delta per pair of pads"""
+    mask = (1 << width) - 1
+    deltas = []
+    for n in range(npairs):
+        delta = (value >> (width * n)) & mask
+        if delta & (1 << (width - 1)):
+            delta -= 1 << width
+        deltas.append(delta)
+    return tuple(deltas)
+
+def decode_slider(value):
+    """Decode the `SLIDER` register"""
+    return SliderState(value & 0xff, bool(value & 0x100), (value >> 9) & 1)
+
+class RegisterAccessor:
+    def __init__(self, bridge, register):
+        self.bridge = bridge
+        self.register = register
+
+    def read(self):
+        return self.register.combine(self.bridge.read_many(self.register.addrs))
+
+    def write(self, value):
+        if not self.register.writable:
+            raise ValueError("register {} is read-only".format(self.register.name))
+        self.bridge.write_many(self.register.addr, self.register.split(value))
+
+class TouchPads:
+    """Accessors for the `touch` block of a running Fomu.
+
+    Every register in the block is available as an attribute with a `read()`
+    and `write()` method, e.g. `pads.cstat.read()` or `pads.capen.write(0xf)`.
+    """
+    accessor = RegisterAccessor
+    SNAPSHOT_REGISTERS = ("ev_pending", "cstat", "i", "o", "oe")
+
+    def __init__(self, bridge, csr_map, name="touch"):
+        if not isinstance(csr_map, CSRMap):
+            csr_map = CSRMap.from_csv(csr_map)
+        self.bridge = bridge
+        self.csr_map = csr_map
+        self.registers = csr_map.block(name)
+        if not self.registers:
+            raise KeyError("no registers for block {} found in csr map".format(name))
+        for short_name, register in self.registers.items():
+            setattr(self, short_name, self.accessor(bridge, register))
+
+        self.data_base = csr_map.regions.get(name + "_data", (None, None))[0]
+        # Gateware from before the pad count was recorded always has four
+        self.npads = int(csr_map.constants.get(name + "_pads", 4))
+        if name + "_count_width" in csr_map.constants:
+            self.count_width = int(csr_map.constants[name + "_count_width"])
+        else:
+            # Older gateware has four pads, whose thresholds exactly fill
+            # `CPRESS`, so the width can be worked out from its size.
+            cpress = self.registers["cpress"]
+            self.count_width = cpress.size * cpress.data_width // self.npads
+        # Mutual capacitance deltas were one bit wider than a count before
+        # their width was recorded
+        self.delta_width = int(csr_map.constants.get(name + "_delta_width", self.count_width + 1))
+        # Clock frequency that sample timestamps count in.  Fomu runs at 12 MHz.
+        self.clk_freq = csr_map.constants.get("config_clock_frequency",
+                                              csr_map.constants.get("system_clock_frequency", 12000000))
+
+        count_registers = ["c{}".format(n) for n in range(1, self.npads + 1)]
+        self.has_counts = all(r in self.registers for r in count_registers)
+        self.snapshot_registers = [self.registers[r] for r in self.SNAPSHOT_REGISTERS]
+        if self.has_counts:
+            self.snapshot_registers = [self.registers[r] for r in count_registers] + self.snapshot_registers
+
+    def read_registers(self, registers):
+        """Read every register in `registers` in as few packets as possible,
+        returning their values in order."""
+        return combine_registers(registers, self.bridge.read_many(register_addrs(registers)))
+
+    def snapshot(self):
+        return self.make_snapshot(self.read_registers(self.snapshot_registers))
+
+    def make_snapshot(self, values):
+        if self.has_counts:
+            return Snapshot(tuple(values[:self.npads]), *values[self.npads:])
+        return Snapshot(None, *values)
+
+    def sample_addrs(self):
+        if self.data_base is None:
+            raise ValueError("gateware was built without the touch_data window")
+        return [self.data_base + SNAPSHOT_OFFSET + 4 * i for i in range(sample_words(self.count_width, self.npads))]
+
+    def sample(self):
+        """Read a `Sample` from the snapshot slot.
+
+        Unlike `snapshot()`, every value is guaranteed to come from the same
+        sample period.  Returns `None` if the first period has not ended yet.
+        """
+        return decode_sample(self.bridge.read_many(self.sample_addrs()), self.count_width, self.npads)
+
+    def fifo_addrs(self, count):
+        if self.data_base is None:
+            raise ValueError("gateware was built without the touch_data window")
+        words = fifo_words(self.count_width, self.npads)
+        return [self.data_base + FIFO_OFFSET + 4 * i for i in range(words)] * count
+
+    def decode_fifo(self, words):
+        n = fifo_words(self.count_width, self.npads)
+        entries = [decode_fifo_entry(words[i:i + n], self.count_width, self.npads) for i in range(0, len(words), n)]
+        return [entry for entry in entries if entry is not None]
+
+    def drain(self):
+        """Read every sample waiting in the FIFO, oldest first.
+
+        Each entry is removed as its last word is read, so the whole FIFO is
+        emptied by reading the same few words over and over.  These reads go
+        out together, so this costs a single round trip once the level is known.
+        """
+        count = self.fifo_level.read()
+        if not count:
+            return []
+        return self.decode_fifo(self.bridge.read_many(self.fifo_addrs(count)))
+
+    def pair_layout(self):
+        """Number of pairs in `MDELTA`, and the width of each delta"""
+        if "mdelta" not in self.registers:
+            raise ValueError("gateware was built without mutual capacitance mode")
+        return self.npads // 2, self.delta_width
+
+    def pair_deltas(self):
+        """Read the mutual capacitance delta of each pair of pads, for pad 1
+        transmitting to pad 2, pad 3 to pad 4 and so on.  A touch near a pair
+        makes its delta smaller."""
+        layout = self.pair_layout()
+        return decode_pair_deltas(self.mdelta.read(), *layout)
+
+    def slider_state(self):
+        """Read the slider position and the direction of the last swipe.
+
+        Wait for `EV_SWIPE`, `EV_TAP` or `EV_DTAP` in `EV_PENDING` rather than
+        polling this, as the gestures are decoded in gateware.
+        """
+        return decode_slider(self.slider.read())
+
+    def event_addrs(self):
+        if self.data_base is None:
+            raise ValueError("gateware was built without the touch_data window")
+        return [self.data_base + EVENT_OFFSET + 4 * i for i in range(event_words(self.npads))]
+
+    def wait_event(self, timeout=None):
+        """Block until a pad is pressed or released and return a `TouchEvent`.
+
+        The gateware holds each read of the event word until an event occurs
+        or `WAIT_TIMEOUT` expires, so this does not poll the bridge while the
+        pads are idle.  Returns `None` if `timeout` seconds pass first.
+        """
+        addrs = self.event_addrs()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            event = decode_event(self.bridge.read_many(addrs), self.npads)
+            if event is not None:
+                return event
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
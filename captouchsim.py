@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# This variable defines all the external programs that this module
+# relies on.  lxbuildenv reads this variable in order to ensure
+# the build will finish without exiting due to missing third-party
+# programs.
+LX_DEPENDENCIES = []
+
+# Import lxbuildenv to integrate the deps/ directory
+import lxbuildenv
+
+# Disable pylint's E1101, which breaks completely on migen
+#pylint:disable=E1101
+
+from migen import Module
+from migen.fhdl.specials import Tristate
+from migen.genlib.record import Record
+from migen.sim import run_simulation, passive
+
+from litex.soc.interconnect import csr_bus
+from litex.soc.interconnect.csr import AutoCSR
+
+import argparse
+import math
+import random
+import sys
+
+from rtl.fomucaptouch import CapTouchPads
+
+class PadModel:
+    """Behavioural model of a single touch pad.
+
+    The pad is an RC node.  Driving it charges or discharges it immediately,
+    and once released it decays towards 0 V with time constant `tau` clock
+    cycles.  It reads as ``1`` while above `threshold` of the supply.
+
+    A finger is modelled as a leakage path to ground, which shortens the time
+    constant to `touched_tau` at full strength.  `noise` randomly varies the
+    time constant of each discharge by up to that fraction, and `drift` adds
+    that fraction to the time constant every sample period, as temperature
+    and humidity would.
+    """
+    def __init__(self, tau=10.0, touched_tau=5.0, threshold=0.5, noise=0.0, drift=0.0):
+        self.tau = tau
+        self.touched_tau = touched_tau
+        self.threshold = threshold
+        self.noise = noise
+        self.drift = drift
+        self.voltage = 0.0
+        self.decay = 1.0
+
+    def time_constant(self, strength, period):
+        idle = self.tau * (1 + self.drift * period)
+        return idle + (self.touched_tau - self.tau) * strength
+
+    def step(self, o, oe, strength, period):
+        if oe:
+            self.voltage = 1.0 if o else 0.0
+            # Pick the time constant for the next discharge
+            tau = self.time_constant(strength, period)
+            if self.noise:
+                tau *= 1 + random.uniform(-self.noise, self.noise)
+            self.decay = math.exp(-1 / max(tau, 0.1))
+        else:
+            self.voltage *= self.decay
+        return self.voltage > self.threshold
+
+class TouchProfile:
+    """A script of presses, measured in sample periods.
+
+    Each press holds a pad from period `start` until just before period `end`
+    at the given `strength`, where ``1.0`` is a full touch.
+    """
+    def __init__(self):
+        self.presses = []
+
+    def press(self, pad, start, end, strength=1.0):
+        self.presses.append((pad, start, end, strength))
+        return self
+
+    @classmethod
+    def parse(cls, specs):
+        """Build a profile from strings of the form ``PAD:START:END[:STRENGTH]``"""
+        profile = cls()
+        for spec in specs:
+            parts = spec.split(":")
+            if len(parts) not in (3, 4):
+                raise ValueError("touch must be PAD:START:END[:STRENGTH], not {}".format(spec))
+            strength = float(parts[3]) if len(parts) == 4 else 1.0
+            profile.press(int(parts[0]), int(parts[1]), int(parts[2]), strength)
+        return profile
+
+    def strength(self, pad, period):
+        return max([s for (p, start, end, s) in self.presses
+                    if p == pad and start <= period < end] + [0.0])
+
+    def edges(self):
+        """Return `(period, pad, pressed)` for every change in the script"""
+        edges = []
+        for pad, start, end, _ in self.presses:
+            edges.append((start, pad, True))
+            edges.append((end, pad, False))
+        return sorted(edges)
+
+class CapTouchSim(Module, AutoCSR):
+    """`CapTouchPads` with its pads replaced by `PadModel`s, and its CSRs
+    reachable over a CSR bus as they would be in a SoC."""
+    def __init__(self, npads=4, **kwargs):
+        pads = Record([("t{}".format(n), 1) for n in range(1, npads + 1)])
+        self.submodules.touch = CapTouchPads(pads, debugging=True, **kwargs)
+
+        self.submodules.csrbankarray = csr_bus.CSRBankArray(self,
+            lambda name, memory: 0 if name == "touch" and memory is None else None,
+            data_width=8)
+        self.csr_bus = self.csrbankarray.get_buses()[0]
+
+        # Word address and length of every CSR in the `touch` bank
+        self.csr_addrs = {}
+        for name, csrs, mapaddr, rmap in self.csrbankarray.banks:
+            for c in csrs:
+                words = getattr(c, "simple_csrs", [c])
+                self.csr_addrs[c.name] = (rmap.simple_csrs.index(words[0]), len(words))
+
+        # The simulator has no model for tristate buffers.  These are removed
+        # from the fragment, and the `PadModel`s drive the input side instead.
+        self.pads = pads.flatten()
+
+    def get_sim_fragment(self):
+        fragment = self.get_fragment()
+        tristates = dict((s.target, s) for s in fragment.specials if isinstance(s, Tristate))
+        fragment.specials -= set(tristates.values())
+        return fragment, [tristates[pad] for pad in self.pads]
+
+    def csr_write(self, name, value):
+        """Write `value` to the CSR `name`, one bus word per cycle, and return
+        the number of cycles the write took."""
+        addr, words = self.csr_addrs[name]
+        for i in range(words):
+            yield self.csr_bus.adr.eq(addr + i)
+            yield self.csr_bus.dat_w.eq((value >> (8 * (words - 1 - i))) & 0xff)
+            yield self.csr_bus.we.eq(1)
+            yield
+        yield self.csr_bus.we.eq(0)
+        yield
+        return words + 1
+
+class SimReport:
+    def __init__(self, clk_freq, cycles_per_period):
+        self.clk_freq = clk_freq
+        self.cycles_per_period = cycles_per_period
+        # One `(period, counts, cstat)` per sample period
+        self.samples = []
+        # One `(cycle, cstat)` per change of `cstat`
+        self.transitions = []
+        # The cycle of every touch interrupt
+        self.events = []
+        # One `(cycle, name, slider position)` per decoded gesture
+        self.gestures = []
+
+    def ms(self, cycles):
+        return 1000.0 * cycles / self.clk_freq
+
+    def latencies(self, profile):
+        """Match every edge in `profile` with the first matching change of
+        the pad's `cstat` bit that follows it, returning `(period, pad,
+        pressed, latency_cycles)`.  The latency is `None` if the pad never
+        changed."""
+        results = []
+        for period, pad, pressed in profile.edges():
+            start = period * self.cycles_per_period
+            mask = 1 << (pad - 1)
+            latency = None
+            last = 0
+            for cycle, cstat in self.transitions:
+                if cycle >= start and bool(cstat & mask) == pressed and bool(last & mask) != pressed:
+                    latency = cycle - start
+                    break
+                last = cstat
+            results.append((period, pad, pressed, latency))
+        return results
+
+    def write(self, profile, out):
+        out.write("period  counts              cstat\n")
+        for period, counts, cstat in self.samples:
+            out.write("{:6d}  {}  {:x}\n".format(period, " ".join("{:4d}".format(c) for c in counts), cstat))
+        out.write("\ncstat transitions:\n")
+        for cycle, cstat in self.transitions:
+            out.write("  {:9.3f} ms  {:x}\n".format(self.ms(cycle), cstat))
+        out.write("\n{} touch interrupts\n".format(len(self.events)))
+        if self.gestures:
+            out.write("\ngestures:\n")
+            for cycle, name, pos in self.gestures:
+                out.write("  {:9.3f} ms  {} at position {}\n".format(self.ms(cycle), name, pos))
+        out.write("\nlatency:\n")
+        for period, pad, pressed, latency in self.latencies(profile):
+            out.write("  pad {} {:8s} at period {:4d}: {}\n".format(pad, "press" if pressed else "release", period,
+                "missed" if latency is None else "{:.3f} ms".format(self.ms(latency))))
+
+def simulate(profile, periods, models=None, clk_freq=12e6, registers=None, **kwargs):
+    """Run `CapTouchSim(**kwargs)` for `periods` sample periods, applying
+    `profile` to the pads, and return a `SimReport`.
+
+    `registers` maps CSR names such as ``cpress`` to values that are written
+    before the first sample period ends.  The sample period is set by passing
+    `period` through to `CapTouchPads` rather than by writing ``cper``, as
+    the first period starts before any register can be written.
+    """
+    if registers is None:
+        registers = {}
+    dut = CapTouchSim(**kwargs)
+    touch = dut.touch
+    if models is None:
+        models = [PadModel() for _ in range(touch.npads)]
+    # Sample periods end every `period` + 1 cycles, and the period ending at
+    # cycle 0 is discarded.  When scanning, a sample takes one period per pad.
+    cycles_per_period = touch.cper.storage.reset.value + 1
+    if kwargs.get("scan"):
+        cycles_per_period *= touch.npads
+    report = SimReport(clk_freq, cycles_per_period)
+    fragment, tristates = dut.get_sim_fragment()
+
+    @passive
+    def pads():
+        cycle = 0
+        while True:
+            period = cycle // cycles_per_period
+            for n, (model, ts) in enumerate(zip(models, tristates), start=1):
+                value = model.step((yield ts.o), (yield ts.oe), profile.strength(n, period), period)
+                yield ts.i.eq(value)
+            cycle += 1
+            yield
+
+    @passive
+    def monitor():
+        cycle = 0
+        last = 0
+        while True:
+            cstat = yield touch.cstat.status
+            if cstat != last:
+                report.transitions.append((cycle, cstat))
+                last = cstat
+            if (yield touch.ev.touch.trigger):
+                report.events.append(cycle)
+            if hasattr(touch.ev, "swipe"):
+                pos = yield touch.slider.fields.pos
+                if (yield touch.ev.swipe.trigger):
+                    report.gestures.append((cycle, "swipe " + ("up" if (yield touch.slider.fields.dir) else "down"), pos))
+                for name in ["tap", "dtap"]:
+                    if (yield getattr(touch.ev, name).trigger):
+                        report.gestures.append((cycle, name, pos))
+            cycle += 1
+            yield
+
+    def control():
+        cycle = yield from dut.csr_write("capen", (1 << touch.npads) - 1)
+        for name, value in registers.items():
+            cycle += yield from dut.csr_write(name, value)
+        for period in range(1, periods + 1):
+            # Counts are latched at the end of the period, and are readable
+            # on the following cycle.
+            while cycle < period * cycles_per_period + 2:
+                cycle += 1
+                yield
+            counts = []
+            for n in range(1, touch.npads + 1):
+                counts.append((yield getattr(touch, "c{}".format(n)).status))
+            report.samples.append((period - 1, counts, (yield touch.cstat.status)))
+
+    run_simulation(fragment, [pads(), monitor(), control()])
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate the Fomu captouch block with modelled pads")
+    parser.add_argument(
+        "--touch", action="append", default=[], metavar="PAD:START:END[:STRENGTH]",
+        help="touch a pad from sample period START until END (may be repeated)"
+    )
+    parser.add_argument(
+        "--periods", default=20, type=int, help="number of sample periods to simulate"
+    )
+    parser.add_argument(
+        "--cper", default=500, type=int, help="clock cycles per sample period"
+    )
+    parser.add_argument(
+        "--cpress", type=lambda x: int(x, 0), help="value to write to CPRESS"
+    )
+    parser.add_argument(
+        "--crel", type=lambda x: int(x, 0), help="value to write to CREL"
+    )
+    parser.add_argument(
+        "--ctrl", type=lambda x: int(x, 0), help="value to write to CTRL"
+    )
+    parser.add_argument(
+        "--count-width", default=8, type=int, help="width of each pad count"
+    )
+    parser.add_argument(
+        "--baseline", action="store_true", help="build with baseline tracking"
+    )
+    parser.add_argument(
+        "--filtering", action="store_true", help="build with the count filter"
+    )
+    parser.add_argument(
+        "--pads", default=4, type=int, help="number of pads to build the block with"
+    )
+    parser.add_argument(
+        "--slider", action="store_true", help="build with the slider and gesture decoder"
+    )
+    parser.add_argument(
+        "--scan", action="store_true", help="build with one counter shared between the pads"
+    )
+    parser.add_argument(
+        "--tau", default=10.0, type=float, help="pad discharge time constant, in clock cycles"
+    )
+    parser.add_argument(
+        "--touched-tau", default=5.0, type=float, help="time constant of a fully touched pad"
+    )
+    parser.add_argument(
+        "--noise", default=0.0, type=float, help="random variation of each discharge, as a fraction"
+    )
+    parser.add_argument(
+        "--drift", default=0.0, type=float, help="change in time constant per sample period, as a fraction"
+    )
+    parser.add_argument(
+        "--seed", default=0, type=int, help="seed for the noise model"
+    )
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    registers = {}
+    for name in ["cpress", "crel", "ctrl"]:
+        if getattr(args, name) is not None:
+            registers[name] = getattr(args, name)
+    models = [PadModel(args.tau, args.touched_tau, noise=args.noise, drift=args.drift) for _ in range(args.pads)]
+    profile = TouchProfile.parse(args.touch)
+
+    report = simulate(profile, args.periods, models, registers=registers, period=args.cper,
+                      count_width=args.count_width, baseline=args.baseline, filtering=args.filtering,
+                      scan=args.scan, slider=args.slider, npads=args.pads)
+    report.write(profile, sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# This variable defines all the external programs that this module
+# relies on.  lxbuildenv reads this variable in order to ensure
+# the build will finish without exiting due to missing third-party
+# programs.
+LX_DEPENDENCIES = ["yosys"]
+
+# Import lxbuildenv to integrate the deps/ directory
+import lxbuildenv
+
+# Disable pylint's E1101, which breaks completely on migen
+#pylint:disable=E1101
+
+from migen import Module
+from migen.fhdl import verilog
+from migen.genlib.record import Record
+
+from litex.soc.interconnect import csr_bus
+from litex.soc.interconnect.csr import AutoCSR
+
+import argparse
+import collections
+import os
+
+import toolchain
+from captouchsoc import touch_options
+from rtl.fomucaptouch import CapTouchPads
+
+# Each configuration compared by the report, and whether it scans the pads
+CONFIGURATIONS = [
+    ("parallel", False),
+    ("scan", True),
+]
+
+class CapTouchTop(Module, AutoCSR):
+    """`CapTouchPads` with its CSR bus and memory window brought out to ports,
+    so that synthesis keeps all of its logic."""
+    def __init__(self, npads=4, **kwargs):
+        pads = Record([("t{}".format(n), 1) for n in range(1, npads + 1)])
+        self.submodules.touch = CapTouchPads(pads, **kwargs)
+
+        self.submodules.csrbankarray = csr_bus.CSRBankArray(self,
+            lambda name, memory: 0 if name == "touch" and memory is None else None,
+            data_width=8)
+        self.ios = set(pads.flatten()) | set(self.csrbankarray.get_buses()[0].flatten())
+        if hasattr(self.touch, "bus"):
+            self.ios |= set(self.touch.bus.flatten())
+
+def format_report(cells):
+    lines = ["{:10} {:>6} {:>6} {:>6} {:>6}".format("", "LUT4", "CARRY", "DFF", "RAM")]
+    for name, counts in cells.items():
+        dffs = sum(count for cell, count in counts.items() if cell.startswith("SB_DFF"))
+        lines.append("{:10} {:6} {:6} {:6} {:6}".format(name, counts.get("SB_LUT4", 0),
+            counts.get("SB_CARRY", 0), dffs, counts.get("SB_RAM40_4K", 0)))
+    base = cells["parallel"].get("SB_LUT4", 0)
+    for name, counts in cells.items():
+        if name != "parallel" and base:
+            saved = base - counts.get("SB_LUT4", 0)
+            lines.append("{} saves {} LUTs ({:.0f}%)".format(name, saved, 100.0 * saved / base))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the logic used by each configuration of the captouch block")
+    parser.add_argument(
+        "--touch-high-rate", action="store_true",
+        help="use a 2 ms touch sample period with 16-bit counts and no count filtering"
+    )
+    parser.add_argument(
+        "--pads", default=4, type=int, help="number of pads to build the block with"
+    )
+    parser.add_argument(
+        "--output-dir", default=os.path.join("build", "size"),
+        help="directory to write the Verilog and yosys statistics into"
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    # Synthesized with the same options as the full SoC, so the numbers match
+    # what the block costs in a real build.
+    cells = collections.OrderedDict()
+    for name, scan in CONFIGURATIONS:
+        top = CapTouchTop(args.pads, **touch_options(int(12e6), args.touch_high_rate, scan))
+        path = os.path.join(args.output_dir, "touch_{}.v".format(name))
+        verilog.convert(top, ios=top.ios, name="touch_{}".format(name)).write(path)
+        cells[name] = toolchain.synth_cells(path, "touch_{}".format(name), options="-abc9 -dsp")
+
+    print(format_report(cells))
+
+if __name__ == "__main__":
+    main()
@@ -5,234 +5,122 @@
 # programs.
 LX_DEPENDENCIES = ["riscv", "icestorm", "yosys", "nextpnr-ice40"]
 
-# Import lxbuildenv to integrate the deps/ directory
-import lxbuildenv
-
-# Disable pylint's E1101, which breaks completely on migen
-#pylint:disable=E1101
-
-#from migen import *
-from migen import Module, Signal, Instance, ClockDomain, If
-from migen.fhdl.specials import TSTriple
-from migen.fhdl.decorators import ClockDomainsRenamer
-
-from litex.build.lattice.platform import LatticePlatform
-from litex.build.generic_platform import Pins, Subsignal
-from litex.soc.integration.doc import AutoDoc, ModuleDoc
-from litex.soc.integration.soc_core import SoCCore
-from litex.soc.cores.cpu import CPUNone
-from litex.soc.integration.builder import Builder
-from litex.soc.interconnect import wishbone
-
-from litex.soc.cores import up5kspram, spi_flash
-
-from litex_boards.partner.targets.fomu import _CRG
-
-from valentyusb.usbcore import io as usbio
-from valentyusb.usbcore.cpu import dummyusb, eptri
-from valentyusb.usbcore.endpoint import EndpointType
-
-import lxsocdoc
-
 import argparse
+import collections
+import importlib
 import os
-
-from rtl.fomucaptouch import CapTouchPads
-from rtl.sbled import SBLED
-from rtl.sbwarmboot import SBWarmBoot
-
-class Platform(LatticePlatform):
-    def __init__(self, board=None, toolchain="icestorm"):
-        self.board = board
-        if board == "evt":
-            from litex_boards.partner.platforms.fomu_evt import _io, _connectors
-            LatticePlatform.__init__(self, "ice40-up5k-sg48", _io, _connectors, toolchain="icestorm")
-            self.spi_size = 16 * 1024 * 1024
-            self.spi_dummy = 6
-        elif board == "dvt":
-            from litex_boards.partner.platforms.fomu_pvt import _io, _connectors
-            LatticePlatform.__init__(self, "ice40-up5k-uwg30", _io, _connectors, toolchain="icestorm")
-            self.spi_size = 2 * 1024 * 1024
-            self.spi_dummy = 6
-        elif board == "pvt":
-            from litex_boards.partner.platforms.fomu_pvt import _io, _connectors
-            LatticePlatform.__init__(self, "ice40-up5k-uwg30", _io, _connectors, toolchain="icestorm")
-            self.spi_size = 2 * 1024 * 1024
-            self.spi_dummy = 6
-        elif board == "hacker":
-            from litex_boards.partner.platforms.fomu_hacker import _io, _connectors
-            LatticePlatform.__init__(self, "ice40-up5k-uwg30", _io, _connectors, toolchain="icestorm")
-            self.spi_size = 2 * 1024 * 1024
-            self.spi_dummy = 4
-        else:
-            raise ValueError("Unrecognized board: {}.  Known values: evt, dvt, pvt, hacker".format(board))
-
-    def create_programmer(self):
-        raise ValueError("programming is not supported")
-
-
-class BaseSoC(SoCCore, AutoDoc):
-    """Fomu Bootloader and Base SoC
-
-    Fomu is an FPGA that fits in your USB port.  This reference manual
-    documents the basic SoC that runs the bootloader, and that can be
-    reused to run your own RISC-V programs.
-
-    This reference manual only describes a particular version of the SoC.
-    The register sets described here are guaranteed to be available
-    with a given ``major version``, but are not guaranteed to be available on
-    any other version.  Naturally, you are free to create your own SoC
-    that does not provide these hardware blocks. To see what the version of the
-    bitstream you're running, check the ``VERSION`` registers.
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import toolchain
+
+# Everything else, including lxbuildenv, is imported once the arguments are
+# known, so that --help and argument errors don't have to wait for it to
+# check the build environment, or for migen and LiteX to load.
+# `lazy_import()` times each of these for --import-report.
+import_times = collections.OrderedDict()
+start_time = time.time()
+
+def lazy_import(name):
+    start = time.time()
+    module = importlib.import_module(name)
+    import_times.setdefault(name, time.time() - start)
+    return module
+
+def print_import_report():
+    print("Import times:")
+    for name, seconds in import_times.items():
+        print("    {:30} {:8.1f} ms".format(name, 1000 * seconds))
+    print("Run with `python -X importtime` for a breakdown of each module.")
+
+def generate(args, board, seed, output_dir, compile_software):
+    """Elaborate the SoC for `board`, writing its gateware sources, headers and
+    documentation into `output_dir`.
+
+    The toolchain is not run here.  Returns the build key of the gateware.
     """
+    # cpu_type = "vexriscv"
+    # cpu_variant = "min"
+    # if args.with_debug:
+    #     cpu_variant = cpu_variant + "+debug"
 
-    SoCCore.csr_map = {
-        "ctrl":           0,  # provided by default (optional)
-        "crg":            1,  # user
-        "uart_phy":       2,  # provided by default (optional)
-        "uart":           3,  # provided by default (optional)
-        "identifier_mem": 4,  # provided by default (optional)
-        "timer0":         5,  # provided by default (optional)
-        "cpu_or_bridge":  8,
-        "usb":            9,
-        "picorvspi":      10,
-        "touch":          11,
-        "reboot":         12,
-        "rgb":            13,
-        "version":        14,
-        "lxspi":          15,
-        "messible":       16,
-    }
-
-    SoCCore.mem_map = {
-        "rom":      0x00000000,  # (default shadow @0x80000000)
-        "sram":     0x10000000,  # (default shadow @0xa0000000)
-        "spiflash": 0x20000000,  # (default shadow @0xa0000000)
-        "main_ram": 0x40000000,  # (default shadow @0xc0000000)
-        "csr":      0xe0000000,  # (default shadow @0xe0000000)
-    }
-
-    interrupt_map = {
-        "timer0": 2,
-        "usb": 3,
-    }
-    interrupt_map.update(SoCCore.interrupt_map)
-
-    def __init__(self, platform, boot_source="rand",
-                 debug=None, bios_file=None,
-                 use_dsp=True, placer="heap", output_dir="build",
-                 pnr_seed=0,
-                 **kwargs):
-        # Disable integrated RAM as we'll add it later
-        self.integrated_sram_size = 0
-
-        self.output_dir = output_dir
-
-        clk_freq = int(12e6)
-        self.submodules.crg = _CRG(platform)
-
-        SoCCore.__init__(self, platform, clk_freq, integrated_sram_size=0, with_uart=False, **kwargs)
-
-        usb_debug = False
-        if debug is not None:
-            if debug == "uart":
-                from litex.soc.cores.uart import UARTWishboneBridge
-                self.submodules.uart_bridge = UARTWishboneBridge(platform.request("serial"), clk_freq, baudrate=115200)
-                self.add_wb_master(self.uart_bridge.wishbone)
-            elif debug == "usb":
-                usb_debug = True
-            elif debug == "spi":
-                import spibone
-                # Add SPI Wishbone bridge
-                debug_device = [
-                    ("spidebug", 0,
-                        Subsignal("mosi", Pins("dbg:0")),
-                        Subsignal("miso", Pins("dbg:1")),
-                        Subsignal("clk",  Pins("dbg:2")),
-                        Subsignal("cs_n", Pins("dbg:3")),
-                    )
-                ]
-                platform.add_extension(debug_device)
-                spi_pads = platform.request("spidebug")
-                self.submodules.spibone = ClockDomainsRenamer("usb_12")(spibone.SpiWishboneBridge(spi_pads, wires=4))
-                self.add_wb_master(self.spibone.wishbone)
-            if hasattr(self, "cpu") and not isinstance(self.cpu, CPUNone):
-                self.cpu.use_external_variant("rtl/VexRiscv_Fomu_Debug.v")
-                os.path.join(output_dir, "gateware")
-                self.register_mem("vexriscv_debug", 0xf00f0000, self.cpu.debug_bus, 0x100)
-        else:
-            if hasattr(self, "cpu") and not isinstance(self.cpu, CPUNone):
-                self.cpu.use_external_variant("rtl/VexRiscv_Fomu_Crypto.v")
-
-        # SPRAM- UP5K has single port RAM, might as well use it as SRAM to
-        # free up scarce block RAM.
-        spram_size = 128*1024
-        self.submodules.spram = up5kspram.Up5kSPRAM(size=spram_size)
-        self.register_mem("sram", self.mem_map["sram"], self.spram.bus, spram_size)
-
-        # Add USB pads, as well as the appropriate USB controller.  If no CPU is
-        # present, use the DummyUsb controller.
-        usb_pads = platform.request("usb")
-        usb_iobuf = usbio.IoBuf(usb_pads.d_p, usb_pads.d_n, usb_pads.pullup)
-        if hasattr(self, "cpu") and not isinstance(self.cpu, CPUNone):
-            self.submodules.usb = eptri.TriEndpointInterface(usb_iobuf, debug=usb_debug)
-        else:
-            self.submodules.usb = dummyusb.DummyUsb(usb_iobuf, debug=usb_debug)
-
-        if usb_debug:
-            self.add_wb_master(self.usb.debug_bridge.wishbone)
-
-        self.submodules.reboot = SBWarmBoot(self)
+    # if args.no_cpu:
+    cpu_type = None
+    cpu_variant = None
 
-        # Add GPIO pads for the touch buttons
-        platform.add_extension(CapTouchPads.touch_device)
-        self.submodules.touch = CapTouchPads(platform.request("touch_pads"))
+    captouchsoc = lazy_import("captouchsoc")
+    Builder = lazy_import("litex.soc.integration.builder").Builder
+    lxsocdoc = lazy_import("lxsocdoc")
 
-        # Override default LiteX's yosys/build templates
-        assert hasattr(platform.toolchain, "yosys_template")
-        assert hasattr(platform.toolchain, "build_template")
-        platform.toolchain.yosys_template = [
-            "{read_files}",
-            "attrmap -tocase keep -imap keep=\"true\" keep=1 -imap keep=\"false\" keep=0 -remove keep=0",
-            "synth_ice40 -json {build_name}.json -top {build_name}",
-        ]
-        platform.toolchain.build_template = [
-            "yosys -q -l {build_name}.rpt {build_name}.ys",
-            "nextpnr-ice40 --json {build_name}.json --pcf {build_name}.pcf --asc {build_name}.txt \
-            --pre-pack {build_name}_pre_pack.py --{architecture} --package {package}",
-            "icepack {build_name}.txt {build_name}.bin"
+    platform = captouchsoc.Platform(board=board)
+    soc = captouchsoc.BaseSoC(platform, cpu_type=cpu_type, cpu_variant=cpu_variant,
+                            debug=args.with_debug,
+                            bios_file=args.bios,
+                            pnr_seed=seed,
+                            touch_high_rate=args.touch_high_rate,
+                            touch_scan=args.touch_scan,
+                            touch_mutual=args.touch_mutual,
+                            touch_slider=args.touch_slider,
+                            touch_led=args.touch_led,
+                            output_dir=output_dir)
+    # The toolchain is run by `run_toolchain()` rather than by LiteX, so that
+    # seeds can be swept and results cached.  LiteX only writes out the
+    # gateware sources and build script.
+    builder = Builder(soc, output_dir=output_dir, csr_csv=os.path.join(output_dir, "csr.csv"),
+                      compile_software=compile_software, compile_gateware=False)
+    if compile_software:
+        builder.software_packages = [
+            ("bios", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sw")))
         ]
-
-        # Add "-relut -dffe_min_ce_use 4" to the synth_ice40 command.
-        # The "-reult" adds an additional LUT pass to pack more stuff in,
-        # and the "-dffe_min_ce_use 4" flag prevents Yosys from generating a
-        # Clock Enable signal for a LUT that has fewer than 4 flip-flops.
-        # This increases density, and lets us use the FPGA more efficiently.
-        platform.toolchain.yosys_template[2] += " -abc9"
-        if use_dsp:
-            platform.toolchain.yosys_template[2] += " -dsp"
-
-        # Disable final deep-sleep power down so firmware words are loaded
-        # onto softcore's address bus.
-        platform.toolchain.build_template[2] = "icepack -s {build_name}.txt {build_name}.bin"
-
-        # Allow us to set the nextpnr seed
-        platform.toolchain.build_template[1] += " --seed " + str(pnr_seed)
-
-        if placer is not None:
-            platform.toolchain.build_template[1] += " --placer {}".format(placer)
-
-    def copy_memory_file(self, src):
-        import os
-        from shutil import copyfile
-        if not os.path.exists(self.output_dir):
-            os.mkdir(self.output_dir)
-        if not os.path.exists(os.path.join(self.output_dir, "gateware")):
-            os.mkdir(os.path.join(self.output_dir, "gateware"))
-        copyfile(os.path.join("rtl", src), os.path.join(self.output_dir, "gateware", src))
-
+    vns = builder.build()
+    soc.do_exit(vns)
+    lxsocdoc.generate_docs(soc, os.path.join(output_dir, "documentation"), project_name="Fomu Captouch Test", author="Sean Cross")
+    lxsocdoc.generate_svd(soc, os.path.join(output_dir, "software"), vendor="Foosn", name="Fomu")
+
+    return toolchain.build_key(os.path.join(output_dir, "gateware"), platform.sources, sweep_seeds(seed, args.seed_sweep))
+
+def document(args, output_dir):
+    """Generate documentation and SVD from the register map alone, without
+    elaborating the rest of the SoC or needing any board support."""
+    captouchsoc = lazy_import("captouchsoc")
+    GenericPlatform = lazy_import("litex.build.generic_platform").GenericPlatform
+    lxsocdoc = lazy_import("lxsocdoc")
+
+    platform = GenericPlatform("ice40-up5k-uwg30", [])
+    soc = captouchsoc.BaseSoC(platform, cpu_type=None, cpu_variant=None,
+                            touch_high_rate=args.touch_high_rate,
+                            touch_scan=args.touch_scan,
+                            touch_mutual=args.touch_mutual,
+                            touch_slider=args.touch_slider,
+                            touch_led=args.touch_led,
+                            output_dir=output_dir,
+                            document_only=True)
+    soc.finalize()
+    lxsocdoc.generate_docs(soc, os.path.join(output_dir, "documentation"), project_name="Fomu Captouch Test", author="Sean Cross")
+    lxsocdoc.generate_svd(soc, os.path.join(output_dir, "software"), vendor="Foosn", name="Fomu")
+    print("Documentation written to {}".format(os.path.join(output_dir, "documentation")))
+
+def sweep_seeds(seed, seed_sweep):
+    return range(seed, seed + (seed_sweep or 1))
+
+def run_toolchain(key, gateware_dirs, seed_sweep, jobs, cache):
+    """Build the gateware in the first of `gateware_dirs`, all of which share
+    the build key `key`, and copy the results into the others."""
+    first, seed = gateware_dirs[0]
+    summary = cache.restore(key, first) if cache else None
+    if summary is not None:
+        summary = "Gateware is unchanged, restored it from the build cache\n" + summary
+    else:
+        results = toolchain.seed_sweep(first, sweep_seeds(seed, seed_sweep), jobs=jobs)
+        if cache:
+            cache.store(key, first, results)
+        summary = toolchain.format_results(results)
+    for gateware_dir, _ in gateware_dirs[1:]:
+        toolchain.copy_outputs(first, gateware_dir)
+    return summary
 
 def main():
+    import_times["(startup)"] = time.time() - start_time
     parser = argparse.ArgumentParser(
         description="Build Fomu Captouch Test")
     # parser.add_argument(
@@ -244,65 +132,125 @@ def main():
         help="Don't build gateware or software, only build documentation"
     )
     parser.add_argument(
-        "--board", choices=["evt", "dvt", "pvt", "hacker"], default="pvt",
-        help="build foboot for a particular hardware board"
+        "--board", choices=["evt", "dvt", "pvt", "hacker"], default=["pvt"], nargs="+",
+        help="build foboot for particular hardware boards"
     )
     parser.add_argument(
         "--bios", help="use specified file as a BIOS, rather than building one"
     )
     parser.add_argument(
-        "--with-debug", help="enable debug support", choices=["usb", "uart", "spi", None]
+        "--with-debug", default="usb", choices=["usb", "uart", "spi"],
+        help="Wishbone bridge to debug the SoC through (default: usb)"
     )
     parser.add_argument(
         "--no-cpu", help="disable cpu generation for debugging purposes", action="store_true"
     )
     parser.add_argument(
-        "--seed", default=0, help="seed to use in nextpnr"
+        "--seed", default=[0], type=int, nargs="+", help="seeds to use in nextpnr, one build per seed"
+    )
+    parser.add_argument(
+        "--seed-sweep", default=None, type=int, metavar="N",
+        help="place and route with N seeds starting from --seed in parallel, and keep the fastest"
+    )
+    parser.add_argument(
+        "--jobs", default=None, type=int, help="number of nextpnr processes to run at once"
+    )
+    parser.add_argument(
+        "--output-dir", default="build",
+        help="directory to build into.  Each board and seed gets its own subdirectory if there is more than one"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="always run the toolchain, even if the gateware is in the build cache"
+    )
+    parser.add_argument(
+        "--touch-high-rate", action="store_true",
+        help="use a 2 ms touch sample period with 16-bit counts and no count filtering"
+    )
+    parser.add_argument(
+        "--touch-scan", action="store_true",
+        help="measure the touch pads one at a time with a single shared counter, to save logic"
+    )
+    parser.add_argument(
+        "--touch-mutual", action="store_true",
+        help="add a mode that measures pairs of neighbouring pads as transmitter and receiver"
+    )
+    parser.add_argument(
+        "--touch-slider", action="store_true",
+        help="decode slider position, swipes and taps across the pads in gateware"
+    )
+    parser.add_argument(
+        "--touch-led", action="store_true",
+        help="add the RGB LED, with a link that lights it straight from the touch pads"
     )
     parser.add_argument(
         "--export-random-rom-file", help="Generate a random ROM file and save it to a file"
     )
-    args = parser.parse_args()
-
-    output_dir = 'build'
+    parser.add_argument(
+        "--import-report", action="store_true", help="print how long each subsystem took to import"
+    )
+    # Options for lxbuildenv itself, such as --lx-verbose, are left for it
+    args, rest = parser.parse_known_args()
+    unknown = [arg for arg in rest if not arg.startswith("--lx-")]
+    if unknown:
+        parser.error("unrecognized arguments: {}".format(" ".join(unknown)))
+
+    # lxbuildenv checks for LX_DEPENDENCIES and then runs this script again
+    # with the deps/ directory on the path.  Documentation needs none of the
+    # external programs, so the check and the second run are skipped, and
+    # only the path is set up.
+    if args.document_only:
+        os.environ.setdefault("LXBUILDENV_REEXEC", "1")
+    lazy_import("lxbuildenv")
 
     compile_software = False
     # if (args.boot_source == "bios" or args.boot_source == "spi") and args.bios is None:
     #     compile_software = True
 
-    # cpu_type = "vexriscv"
-    # cpu_variant = "min"
-    # if args.with_debug:
-    #     cpu_variant = cpu_variant + "+debug"
-
-    # if args.no_cpu:
-    cpu_type = None
-    cpu_variant = None
-
-    compile_gateware = True
     if args.document_only:
-        compile_gateware = False
-        compile_software = False
-
+        document(args, args.output_dir)
+        if args.import_report:
+            print_import_report()
+        return
+
+    variants = [(board, seed) for board in args.board for seed in args.seed]
+    if len(variants) == 1:
+        output_dirs = [args.output_dir]
+    else:
+        output_dirs = [os.path.join(args.output_dir, board if len(args.seed) == 1 else "{}-seed{}".format(board, seed))
+                       for board, seed in variants]
+
+    # Each board is elaborated in its own process.  The toolchain is run
+    # afterwards, and only once for each distinct set of gateware.  Import
+    # everything up front so that the processes don't each import it again.
     os.environ["LITEX"] = "1" # Give our Makefile something to look for
-    platform = Platform(board=args.board)
-    soc = BaseSoC(platform, cpu_type=cpu_type, cpu_variant=cpu_variant,
-                            debug="usb",
-                            bios_file=args.bios,
-                            pnr_seed=int(args.seed),
-                            output_dir=output_dir)
-    builder = Builder(soc, output_dir=output_dir, csr_csv="build/csr.csv",
-                      compile_software=compile_software, compile_gateware=compile_gateware)
-    if compile_software:
-        builder.software_packages = [
-            ("bios", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sw")))
-        ]
-    vns = builder.build()
-    soc.do_exit(vns)
-    lxsocdoc.generate_docs(soc, "build/documentation/", project_name="Fomu Captouch Test", author="Sean Cross")
-    lxsocdoc.generate_svd(soc, "build/software", vendor="Foosn", name="Fomu")
-
-    print("""Foboot build complete.  Output files:
+    for name in ("captouchsoc", "litex.soc.integration.builder", "lxsocdoc"):
+        lazy_import(name)
+    generate_args = [(args, board, seed, output_dir, compile_software)
+                     for (board, seed), output_dir in zip(variants, output_dirs)]
+    if len(generate_args) == 1:
+        keys = [generate(*generate_args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(generate_args)) as pool:
+            keys = list(pool.map(generate, *zip(*generate_args)))
+
+    builds = collections.OrderedDict()
+    for key, output_dir, (board, seed) in zip(keys, output_dirs, variants):
+        builds.setdefault(key, []).append((os.path.join(output_dir, "gateware"), seed))
+    cache = None if args.no_cache else toolchain.BuildCache()
+    pnr_jobs = args.jobs or max(1, os.cpu_count() // len(builds))
+    with ThreadPoolExecutor(max_workers=len(builds)) as pool:
+        summaries = list(pool.map(lambda build: run_toolchain(build[0], build[1], args.seed_sweep, pnr_jobs, cache),
+                                  builds.items()))
+    for summary, gateware_dirs in zip(summaries, builds.values()):
+        print("{}:\n{}".format(", ".join(d for d, seed in gateware_dirs), summary))
+
+    if len(output_dirs) > 1:
+        print("Foboot build complete.  Output directories:")
+        for (board, seed), output_dir in zip(variants, output_dirs):
+            print("        {:30} {} with seed {}".format(output_dir, board, seed))
+    else:
+        output_dir = output_dirs[0]
+        print("""Foboot build complete.  Output files:
         {}/gateware/top.bin             Bitstream file.  Load this onto the FPGA for testing.
         {}/gateware/top-multiboot.bin   Multiboot-enabled bitstream file.  Flash this onto FPGA ROM.
         {}/gateware/top.v               Source Verilog file.  Useful for debugging issues.
@@ -310,5 +258,8 @@ def main():
         {}/software/bios/bios.elf       ELF file for debugging bios.
     """.format(output_dir, output_dir, output_dir, output_dir, output_dir))
 
+    if args.import_report:
+        print_import_report()
+
 if __name__ == "__main__":
     main()
@@ -69,6 +69,61 @@ int eb_fill_read32(uint8_t wb_buffer[20], uint32_t address) {
     return eb_fill_readwrite32(wb_buffer, 0, address, 1);
 }
 
+static void eb_fill_header(uint8_t *wb_buffer, int wcount, int rcount, uint32_t base_address) {
+    memset(wb_buffer, 0, 16);
+    wb_buffer[0] = 0x4e;	// Magic byte 0
+    wb_buffer[1] = 0x6f;	// Magic byte 1
+    wb_buffer[2] = 0x10;	// Version 1, all other flags 0
+    wb_buffer[3] = 0x44;	// Address is 32-bits, port is 32-bits
+
+    // Record
+    wb_buffer[8] = 0;		// No Wishbone flags are set (cyc, wca, wff, etc.)
+    wb_buffer[9] = 0x0f;	// Byte enable
+    wb_buffer[10] = wcount;	// Write count
+    wb_buffer[11] = rcount;	// Read count
+    base_address = htobe32(base_address);
+    memcpy(&wb_buffer[12], &base_address, sizeof(base_address));
+}
+
+int eb_fill_readv(uint8_t wb_buffer[EB_MAX_PACKET], const uint32_t *addresses, int count) {
+    int i;
+    if ((count < 1) || (count > EB_MAX_RECORD_COUNT))
+        return -1;
+    eb_fill_header(wb_buffer, 0, count, 0);
+    for (i = 0; i < count; i++) {
+        uint32_t address = htobe32(addresses[i]);
+        memcpy(&wb_buffer[16 + (i * 4)], &address, sizeof(address));
+    }
+    return 16 + (count * 4);
+}
+
+int eb_fill_writev(uint8_t wb_buffer[EB_MAX_PACKET], uint32_t address, const uint32_t *data, int count) {
+    int i;
+    if ((count < 1) || (count > EB_MAX_RECORD_COUNT))
+        return -1;
+    eb_fill_header(wb_buffer, count, 0, address);
+    for (i = 0; i < count; i++) {
+        uint32_t value = htobe32(data[i]);
+        memcpy(&wb_buffer[16 + (i * 4)], &value, sizeof(value));
+    }
+    return 16 + (count * 4);
+}
+
+int eb_unfill_readv(const uint8_t *wb_buffer, int len, uint32_t *data, int count) {
+    int i;
+    if ((len < 16) || (wb_buffer[0] != 0x4e) || (wb_buffer[1] != 0x6f))
+        return -1;
+    // Read replies come back as a record of writes
+    if ((wb_buffer[10] != count) || (len < 16 + (count * 4)))
+        return -1;
+    for (i = 0; i < count; i++) {
+        uint32_t value;
+        memcpy(&value, &wb_buffer[16 + (i * 4)], sizeof(value));
+        data[i] = be32toh(value);
+    }
+    return count;
+}
+
 int eb_send(struct eb_connection *conn, const void *bytes, size_t len) {
     if (conn->is_direct)
         return sendto(conn->fd, bytes, len, 0, conn->addr->ai_addr, conn->addr->ai_addrlen);
@@ -81,6 +136,21 @@ int eb_recv(struct eb_connection *conn, void *bytes, size_t max_len) {
     return read(conn->fd, bytes, max_len);
 }
 
+// Receive one reply carrying `len` bytes.  Over TCP a reply may arrive in
+// pieces, so keep reading until all of it is here.
+static int eb_recv_reply(struct eb_connection *conn, uint8_t *bytes, size_t len) {
+    size_t offset = 0;
+    if (conn->is_direct)
+        return eb_recv(conn, bytes, len);
+    while (offset < len) {
+        int count = read(conn->fd, bytes + offset, len - offset);
+        if (count <= 0)
+            return offset ? (int)offset : count;
+        offset += count;
+    }
+    return offset;
+}
+
 void eb_write32(struct eb_connection *conn, uint32_t val, uint32_t addr) {
     uint8_t raw_pkt[20];
     eb_fill_write32(raw_pkt, val, addr);
@@ -101,6 +171,47 @@ uint32_t eb_read32(struct eb_connection *conn, uint32_t addr) {
     return eb_unfill_read32(raw_pkt);
 }
 
+int eb_readv(struct eb_connection *conn, const uint32_t *addrs, uint32_t *values, size_t count) {
+    uint8_t raw_pkt[EB_MAX_PACKET];
+    size_t offset;
+
+    // Send every packet before waiting for the first reply, so the whole
+    // transfer costs a single round trip.
+    for (offset = 0; offset < count; offset += EB_MAX_RECORD_COUNT) {
+        int batch = (count - offset) > EB_MAX_RECORD_COUNT ? EB_MAX_RECORD_COUNT : (count - offset);
+        int len = eb_fill_readv(raw_pkt, addrs + offset, batch);
+        if (eb_send(conn, raw_pkt, len) != len) {
+            fprintf(stderr, "couldn't send read request: %s\n", strerror(errno));
+            return -1;
+        }
+    }
+
+    for (offset = 0; offset < count; offset += EB_MAX_RECORD_COUNT) {
+        int batch = (count - offset) > EB_MAX_RECORD_COUNT ? EB_MAX_RECORD_COUNT : (count - offset);
+        int len = eb_recv_reply(conn, raw_pkt, 16 + (batch * 4));
+        if (eb_unfill_readv(raw_pkt, len, values + offset, batch) != batch) {
+            fprintf(stderr, "unexpected read reply length: %d\n", len);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+int eb_writev(struct eb_connection *conn, uint32_t addr, const uint32_t *values, size_t count) {
+    uint8_t raw_pkt[EB_MAX_PACKET];
+    size_t offset;
+
+    for (offset = 0; offset < count; offset += EB_MAX_RECORD_COUNT) {
+        int batch = (count - offset) > EB_MAX_RECORD_COUNT ? EB_MAX_RECORD_COUNT : (count - offset);
+        int len = eb_fill_writev(raw_pkt, addr + (offset * 4), values + offset, batch);
+        if (eb_send(conn, raw_pkt, len) != len) {
+            fprintf(stderr, "couldn't send write request: %s\n", strerror(errno));
+            return -1;
+        }
+    }
+    return 0;
+}
+
 struct eb_connection *eb_connect(const char *addr, const char *port, int is_direct) {
 
     struct addrinfo hints;
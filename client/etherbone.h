@@ -56,19 +56,41 @@ is set to 1.  For a read, the read_addr is specified.  For a write, the
 write_addr is specified along with a value.
 
 The same type of record is returned, so your data is at offset 16.
+
+That single record may carry up to 255 reads or writes, though.  For reads,
+each word following the record header is an address to read, and the reply
+is a record of writes holding each value in turn.  For writes, the words
+following write_addr are written to consecutive addresses.  eb_readv() and
+eb_writev() use this to transfer many words per packet, and send every
+packet before waiting for any reply.
 */
 
+// The most reads or writes a single record can carry
+#define EB_MAX_RECORD_COUNT 255
+#define EB_MAX_PACKET (16 + (EB_MAX_RECORD_COUNT * 4))
+
 struct eb_connection;
 
 int eb_unfill_read32(uint8_t wb_buffer[20]);
 int eb_fill_write32(uint8_t wb_buffer[20], uint32_t data, uint32_t address);
 int eb_fill_read32(uint8_t wb_buffer[20], uint32_t address);
+int eb_fill_readv(uint8_t wb_buffer[EB_MAX_PACKET], const uint32_t *addresses, int count);
+int eb_fill_writev(uint8_t wb_buffer[EB_MAX_PACKET], uint32_t address, const uint32_t *data, int count);
+int eb_unfill_readv(const uint8_t *wb_buffer, int len, uint32_t *data, int count);
 
 struct eb_connection *eb_connect(const char *addr, const char *port, int is_direct);
 void eb_disconnect(struct eb_connection **conn);
 uint32_t eb_read32(struct eb_connection *conn, uint32_t addr);
 void eb_write32(struct eb_connection *conn, uint32_t val, uint32_t addr);
 
+// Read `count` words from the addresses in `addrs` into `values`.
+// Returns 0 on success or -1 on error.
+int eb_readv(struct eb_connection *conn, const uint32_t *addrs, uint32_t *values, size_t count);
+
+// Write `count` words from `values` to consecutive words starting at `addr`.
+// Returns 0 on success or -1 on error.
+int eb_writev(struct eb_connection *conn, uint32_t addr, const uint32_t *values, size_t count);
+
 #ifdef __cplusplus
 };
 #endif /* __cplusplus */
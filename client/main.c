@@ -15,6 +15,56 @@ void csr_writel(uint32_t val, unsigned long addr) {
     eb_write32(eb, val, addr);
 }
 
+// Registers read on every pass of the status loop.  These are fetched with
+// a single eb_readv() call, so the whole set costs one round trip.
+enum {
+#ifdef CSR_TOUCH_C1_ADDR
+    REG_C1, REG_C2, REG_C3, REG_C4,
+#endif
+    REG_EV_PENDING, REG_CSTAT, REG_I, REG_O, REG_OE,
+    REG_COUNT,
+};
+
+static const struct {
+    unsigned long addr;
+    int size;
+} status_regs[REG_COUNT] = {
+#ifdef CSR_TOUCH_C1_ADDR
+    { CSR_TOUCH_C1_ADDR, CSR_TOUCH_C1_SIZE },
+    { CSR_TOUCH_C2_ADDR, CSR_TOUCH_C2_SIZE },
+    { CSR_TOUCH_C3_ADDR, CSR_TOUCH_C3_SIZE },
+    { CSR_TOUCH_C4_ADDR, CSR_TOUCH_C4_SIZE },
+#endif
+    { CSR_TOUCH_EV_PENDING_ADDR, CSR_TOUCH_EV_PENDING_SIZE },
+    { CSR_TOUCH_CSTAT_ADDR, CSR_TOUCH_CSTAT_SIZE },
+    { CSR_TOUCH_I_ADDR, CSR_TOUCH_I_SIZE },
+    { CSR_TOUCH_O_ADDR, CSR_TOUCH_O_SIZE },
+    { CSR_TOUCH_OE_ADDR, CSR_TOUCH_OE_SIZE },
+};
+
+// CSRs are 8 bits wide, so a wider register spans several words, most
+// significant byte first.
+static int read_status(uint32_t values[REG_COUNT]) {
+    uint32_t addrs[REG_COUNT * 4];
+    uint32_t words[REG_COUNT * 4];
+    int reg, word, count = 0;
+
+    for (reg = 0; reg < REG_COUNT; reg++)
+        for (word = 0; word < status_regs[reg].size; word++)
+            addrs[count++] = status_regs[reg].addr + (word * 4);
+
+    if (eb_readv(eb, addrs, words, count))
+        return -1;
+
+    count = 0;
+    for (reg = 0; reg < REG_COUNT; reg++) {
+        values[reg] = 0;
+        for (word = 0; word < status_regs[reg].size; word++)
+            values[reg] = (values[reg] << 8) | (words[count++] & 0xff);
+    }
+    return 0;
+}
+
 int main(int argc, char **argv) {
     eb = eb_connect("127.0.0.1", "1234", 0);
     if (!eb) {
@@ -29,28 +79,36 @@ int main(int argc, char **argv) {
     // touch_o_write(0);
     // touch_oe_write(0);
 
-#ifdef CSR_TOUCH_CPER_ADDR
-    touch_cper_write(524288);
-    touch_cpress_write(0x08);
-    touch_crel_write(0x02);
+    // CPER is left at the sample period the gateware was built with.  High-rate
+    // builds have wider counts, and keep their default thresholds.
+#if defined(CSR_TOUCH_CPRESS_ADDR) && CSR_TOUCH_CPRESS_SIZE == 4
+    // One byte per pad, with pad 1 in the lowest byte
+    touch_cpress_write(0x08080808);
+    touch_crel_write(0x02020202);
 #endif
 
     while (1) {
+        uint32_t regs[REG_COUNT];
+        if (read_status(regs)) {
+            fprintf(stderr, "Couldn't read status\n");
+            exit(1);
+        }
+
         fprintf(stderr, "\r");
 
 #ifdef CSR_TOUCH_C1_ADDR
-        uint8_t c1 = touch_c1_read();
-        uint8_t c2 = touch_c2_read();
-        uint8_t c3 = touch_c3_read();
-        uint8_t c4 = touch_c4_read();
+        unsigned int c1 = regs[REG_C1];
+        unsigned int c2 = regs[REG_C2];
+        unsigned int c3 = regs[REG_C3];
+        unsigned int c4 = regs[REG_C4];
         fprintf(stderr, "%02x %02x %02x %02x  ", c1, c2, c3, c4);
 #endif
 
-        uint8_t evp = touch_ev_pending_read();
-        uint8_t stat = touch_cstat_read();
-        uint8_t in = touch_i_read();
-        uint8_t out = touch_o_read();
-        uint8_t oe = touch_oe_read();
+        uint8_t evp = regs[REG_EV_PENDING];
+        uint8_t stat = regs[REG_CSTAT];
+        uint8_t in = regs[REG_I];
+        uint8_t out = regs[REG_O];
+        uint8_t oe = regs[REG_OE];
         fprintf(stderr, "EV_PEND: %02x  Status: %02x  In: %02x / %02x / %02x", evp, stat, in, out, oe);
         if (evp) {
             unsigned int i;
@@ -12,6 +12,10 @@ import argparse
 
 DEPS_DIR = "deps"
 
+# Results of the dependency and submodule checks are kept here, so that they
+# only need to be redone when something has changed.
+CACHE_FILE = ".lxbuildenv_cache"
+
 DEFAULT_DEPS = {
     'migen':        'https://github.com/m-labs/migen.git',
     'litex':        'https://github.com/enjoy-digital/litex.git',
@@ -230,15 +234,74 @@ dependency_checkers = {
     'nextpnr-ecp5': check_nextpnr_ecp5,
 }
 
+# Dependencies whose checks have no side effects, and which can therefore be
+# cached.  Vivado is excluded because finding it may modify PATH.
+cacheable_dependencies = [
+    'make', 'git', 'riscv', 'yosys', 'arachne-pnr', 'icestorm', 'nextpnr-ice40', 'nextpnr-ecp5',
+]
+
+def read_cache(script_path):
+    import json
+    try:
+        with open(script_path + CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+        if cache.get('version') == LXBUILDENV_VERSION:
+            return cache
+    except:
+        pass
+    return {'version': LXBUILDENV_VERSION}
+
+def write_cache(script_path, cache):
+    import json
+    try:
+        with open(script_path + CACHE_FILE, 'w') as f:
+            json.dump(cache, f)
+    except:
+        pass
+
+# A successful check is still valid if PATH is the same and the tool that
+# was found hasn't been replaced.  Failed checks are never cached.
+def cached_dependency(cache, dependency_name):
+    entry = cache.get('dependencies', {}).get(dependency_name)
+    if entry is None or entry['PATH'] != os.environ["PATH"]:
+        return None
+    try:
+        if os.stat(entry['path']).st_mtime != entry['mtime']:
+            return None
+    except OSError:
+        return None
+    return (True, entry['result'])
+
+def cache_dependency(cache, dependency_name, result):
+    if not result[0] or not result[1].startswith("found at "):
+        return
+    path = result[1][len("found at "):]
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return
+    cache.setdefault('dependencies', {})[dependency_name] = {
+        'PATH': os.environ["PATH"],
+        'path': path,
+        'mtime': mtime,
+        'result': result[1],
+    }
+
 # Validate that the required dependencies (Vivado, compilers, etc.)
 # have been installed.
-def check_dependencies(args, dependency_list):
+def check_dependencies(args, dependency_list, cache=None):
     dependency_errors = 0
     for dependency_name in dependency_list:
         if not dependency_name in dependency_checkers:
             print('lxbuildenv: WARNING: Unrecognized dependency "{}"'.format(dependency_name))
             continue
-        result = dependency_checkers[dependency_name](args)
+        result = None
+        if cache is not None and dependency_name in cacheable_dependencies:
+            result = cached_dependency(cache, dependency_name)
+        if result is None:
+            result = dependency_checkers[dependency_name](args)
+            if cache is not None and dependency_name in cacheable_dependencies:
+                cache_dependency(cache, dependency_name, result)
         if result[0] == False:
             if len(result) > 2:
                 print('lxbuildenv: {}: {} -- {}'.format(dependency_name, result[1], result[2]))
@@ -305,16 +368,70 @@ def check_module_recursive(root_path, depth, verbose=False, breadcrumbs=[]):
                 return True
     return False
 
+# Read the commit that the repo at `path` has checked out without running git.
+# Returns None if it has no .git directory, i.e. it needs initializing.
+def read_git_head(path):
+    git_dir = path + os.path.sep + '.git'
+    if os.path.isfile(git_dir):
+        # Submodules have a .git file pointing at their real git directory
+        with open(git_dir, 'r') as f:
+            line = f.read().strip()
+        if not line.startswith('gitdir:'):
+            return None
+        git_dir = os.path.join(path, line[len('gitdir:'):].strip())
+    try:
+        with open(git_dir + os.path.sep + 'HEAD', 'r') as f:
+            head = f.read().strip()
+        if head.startswith('ref:'):
+            ref_file = git_dir + os.path.sep + head[len('ref:'):].strip()
+            if os.path.isfile(ref_file):
+                with open(ref_file, 'r') as f:
+                    head = head + ' ' + f.read().strip()
+    except OSError:
+        return None
+    return head
+
+# Summarize the checked-out commit of every submodule under root_path,
+# recursively.  Returns None if any of them isn't checked out.
+def submodule_state(root_path):
+    state = []
+    gitmodules_path = root_path + os.path.sep + '.gitmodules'
+    if not os.path.isfile(gitmodules_path):
+        return state
+    with open(gitmodules_path, 'r') as gitmodules:
+        for line in gitmodules:
+            parts = line.split("=", 2)
+            if parts[0].strip() == "path":
+                path = parts[1].strip()
+                head = read_git_head(root_path + os.path.sep + path)
+                substate = submodule_state(root_path + os.path.sep + path)
+                if head is None or substate is None:
+                    return None
+                state.append([path, head, substate])
+    return state
+
 # Determine whether we need to invoke "git submodules init --recurse"
-def check_submodules(script_path, args):
+def check_submodules(script_path, args, cache=None):
+    # If no submodule has changed since they were last found to be
+    # initialized, there's no need to check them again.
+    state = None
+    if read_git_head(script_path.rstrip(os.path.sep)) is not None:
+        state = submodule_state(script_path.rstrip(os.path.sep))
+    if cache is not None and state is not None and cache.get('submodules') == state:
+        if args.lx_verbose and not args.lx_quiet:
+            print("lxbuildenv: Submodule check: Submodules unchanged since last check")
+        return
+
     if check_module_recursive(script_path, 0, verbose=args.lx_verbose):
         if not args.lx_quiet:
             print("lxbuildenv: Missing git submodules -- updating")
             print("lxbuildenv: To ignore git issues, re-run with --lx-ignore-git")
         subprocess.Popen(["git", "submodule", "update",
                           "--init", "--recursive"], cwd=script_path).wait()
-    elif args.lx_verbose:
-        if not args.lx_quiet:
+    else:
+        if cache is not None and state is not None:
+            cache['submodules'] = state
+        if args.lx_verbose and not args.lx_quiet:
             print("lxbuildenv: Submodule check: Submodules found")
 
 
@@ -570,6 +687,9 @@ elif "LXBUILDENV_REEXEC" not in os.environ:
     parser.add_argument(
         "--lx-check-git", help="force a git check even if it's otherwise disabled", action="store_true"
     )
+    parser.add_argument(
+        "--lx-recheck", help="ignore cached results and redo every check", action="store_true"
+    )
     (args, rest) = parser.parse_known_args()
 
     if not args.lx_quiet:
@@ -582,10 +702,14 @@ elif "LXBUILDENV_REEXEC" not in os.environ:
     config = read_configuration(sys.argv[0], args)
     deps = config['dependencies']
 
+    cache = read_cache(script_path)
+    if args.lx_recheck:
+        cache = {'version': LXBUILDENV_VERSION}
+
     fixup_env(script_path, args)
-    check_dependencies(args, deps)
+    check_dependencies(args, deps, cache)
     if args.lx_check_git:
-        check_submodules(script_path, args)
+        check_submodules(script_path, args, cache)
     elif config['skip-git']:
         if not args.lx_quiet:
             print('lxbuildenv: Skipping git configuration because "skip-git" was found in LX_CONFIGURATION')
@@ -594,7 +718,8 @@ elif "LXBUILDENV_REEXEC" not in os.environ:
         if not args.lx_quiet:
             print('lxbuildenv: Skipping git configuration because "--lx-ignore-git" Was specified')
     else:
-        check_submodules(script_path, args)
+        check_submodules(script_path, args, cache)
+    write_cache(script_path, cache)
 
     try:
         sys.exit(subprocess.Popen(
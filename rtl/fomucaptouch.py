@@ -1,19 +1,59 @@
-from migen import Module, TSTriple, Cat, Signal, If, wrap
+from migen import Module, TSTriple, Cat, Signal, If, Case, Mux, Array, Replicate, ResetInserter, wrap, bits_for
+from migen.genlib.fifo import SyncFIFOBuffered
 from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage, CSRField
 from litex.soc.integration.doc import ModuleDoc
 from litex.build.generic_platform import Pins, Subsignal
 from litex.soc.interconnect import csr_eventmanager as ev
+from litex.soc.interconnect import wishbone
 
-class CapTouchPads(Module, AutoCSR):
-    touch_device = [
+class _WindowSlot:
+    """A group of up to 16 words in the ``touch_data`` window.
+
+    `data` is packed into consecutive 32-bit words, and bit 31 of the last
+    word reflects `valid`.  Reads of the slot are held off until `ready` is
+    high.  `selected` is high while a read of the slot is in progress,
+    `start` pulses as the first word is returned, and `done` pulses when the
+    last word has been read.
+
+    The whole slot is latched as its first word is returned, and `words`
+    hold the latched values until the last word has been read, so words read
+    in order always come from the same clock cycle.
+    """
+    def __init__(self, data, valid, ready=1):
+        nwords = (len(data) + 1 + 31) // 32
+        assert nwords <= 16
+        padding = nwords * 32 - len(data) - 1
+        self.live = Cat(data, Replicate(0, padding), valid) if padding else Cat(data, valid)
+        self.data = Signal(nwords * 32)
+        self.words = [self.data[i*32:(i+1)*32] for i in range(nwords)]
+        self.ready = ready
+        self.selected = Signal()
+        self.start = Signal()
+        self.done = Signal()
+
+def _lane(signals, index):
+    """`signals[index]`, where `index` is either a constant or a Signal"""
+    if isinstance(index, int):
+        return signals[index]
+    return Array(signals)[index]
+
+def touch_device(npads=4, connector="touch_pins"):
+    """Platform extension describing `npads` pads, named ``t1`` onwards, on
+    consecutive pins of `connector`"""
+    return [
         ("touch_pads", 0,
-            Subsignal("t1", Pins("touch_pins:0")),
-            Subsignal("t2", Pins("touch_pins:1")),
-            Subsignal("t3", Pins("touch_pins:2")),
-            Subsignal("t4", Pins("touch_pins:3")),
+            *[Subsignal("t{}".format(n), Pins("{}:{}".format(connector, n - 1))) for n in range(1, npads + 1)]
         )
     ]
-    def __init__(self, pads, debugging=False):
+
+def _pad_fields(prefix, npads, description, **kwargs):
+    return [CSRField("{}{}".format(prefix, n), description=description.format(n), **kwargs) for n in range(1, npads + 1)]
+
+class CapTouchPads(Module, AutoCSR):
+    touch_device = touch_device()
+    def __init__(self, pads, debugging=False, fifo_depth=None, event_wait=False, baseline=False,
+                 filtering=False, count_width=8, period=524288, snapshot=False, scan=False, mutual=False,
+                 slider=False, wait_limit=900000, filter_shift=2):
         self.intro = ModuleDoc("""Fomu Touchpads
 
         Fomu has four single-ended exposed pads on its side.  These pads are designed
@@ -25,109 +65,203 @@ class CapTouchPads(Module, AutoCSR):
 
         More research will need to be done in order to determine sane defaults for the
         trigger levels.
-        """)
 
-        cap_signal_size = 8
-
-        touch1 = TSTriple()
-        touch2 = TSTriple()
-        touch3 = TSTriple()
-        touch4 = TSTriple()
-        self.specials += touch1.get_tristate(pads.t1)
-        self.specials += touch2.get_tristate(pads.t2)
-        self.specials += touch3.get_tristate(pads.t3)
-        self.specials += touch4.get_tristate(pads.t4)
-        ios = [touch1, touch2, touch3, touch4]
-
-        self.o      = CSRStorage(4, description="Output values for pads 1-4", fields=[
-            CSRField("o1", description="Output value for pad 1"),
-            CSRField("o2", description="Output value for pad 2"),
-            CSRField("o3", description="Output value for pad 3"),
-            CSRField("o4", description="Output value for pad 4"),
-        ])
-        self.oe     = CSRStorage(4, description="Output enable control for pads 1-4", fields=[
-            CSRField("oe1", description="Output Enable value for pad 1"),
-            CSRField("oe2", description="Output Enable value for pad 2"),
-            CSRField("oe3", description="Output Enable value for pad 3"),
-            CSRField("oe4", description="Output Enable value for pad 4"),
-        ])
-        self.i      = CSRStatus(4, description="Input value for pads 1-4", fields=[
-            CSRField("i1", description="Input value for pad 1"),
-            CSRField("i2", description="Input value for pad 2"),
-            CSRField("i3", description="Input value for pad 3"),
-            CSRField("i4", description="Input value for pad 4"),
-        ])
-        self.capen  = CSRStorage(4, description="Enable captouch for pads 1-4", fields=[
-            CSRField("t1", description="Enable captouch for pad 1"),
-            CSRField("t2", description="Enable captouch for pad 2"),
-            CSRField("t3", description="Enable captouch for pad 3"),
-            CSRField("t4", description="Enable captouch for pad 4"),
-        ])
-
-        cper = 524288
-        cap_count_len = 20
-        cpress = 0x0a
-        crel = 0x03
-
-        self.cstat  = CSRStatus(4, description="Current status of the captouch buttons", fields=[
-            CSRField("s1", description="State of pad 1"),
-            CSRField("s2", description="State of pad 2"),
-            CSRField("s3", description="State of pad 3"),
-            CSRField("s4", description="State of pad 4"),
-        ])
+        This instance drives {} pads.  Every register below holds one bit or field per
+        pad, with pad 1 in the lowest bits.
+        """.format(len(pads.flatten())))
 
-        if debugging:
-            cap_count_len = 32
-            self.cper   = CSRStorage(cap_count_len, description="""The number of clock cycles for one sample period
+        cap_signal_size = self.count_width = count_width
+
+        # One pad per signal of `pads`, in order.  Use `touch_device()` to
+        # describe more pads than Fomu has.
+        ios = []
+        for pin in pads.flatten():
+            io = TSTriple()
+            self.specials += io.get_tristate(pin)
+            ios.append(io)
+        self.npads = npads = len(ios)
+        pad_range = "1-{}".format(npads)
+
+        self.o      = CSRStorage(npads, description="Output values for pads " + pad_range,
+                                 fields=_pad_fields("o", npads, "Output value for pad {}"))
+        self.oe     = CSRStorage(npads, description="Output enable control for pads " + pad_range,
+                                 fields=_pad_fields("oe", npads, "Output Enable value for pad {}"))
+        self.i      = CSRStatus(npads, description="Input value for pads " + pad_range,
+                                fields=_pad_fields("i", npads, "Input value for pad {}"))
+        self.capen  = CSRStorage(npads, description="Enable captouch for pads " + pad_range,
+                                 fields=_pad_fields("t", npads, "Enable captouch for pad {}"))
 
-            The hardware will count how many times the touchpad discharges within this sample
-            period and reflect that value in the corresponding `count` register.""", reset=524288)
-            cper = self.cper.storage
+        self.cstat  = CSRStatus(npads, description="Current status of the captouch buttons",
+                                fields=_pad_fields("s", npads, "State of pad {}"))
 
-            self.cpress = CSRStorage(cap_signal_size, reset=0x0a, description="Count threshold for triggering a ``press`` event")
-            cpress = self.cpress.storage
-            self.crel   = CSRStorage(cap_signal_size, reset=0x03, description="Count threshold for triggering a ``release`` event")
-            crel = self.crel.storage
+        cap_count_len = 32 if debugging else 20
+        self.cper   = CSRStorage(cap_count_len, description="""The number of clock cycles for one sample period
 
-            self.c1     = CSRStatus(cap_signal_size, description="Count of events for pad 1")
-            self.c2     = CSRStatus(cap_signal_size, description="Count of events for pad 2")
-            self.c3     = CSRStatus(cap_signal_size, description="Count of events for pad 3")
-            self.c4     = CSRStatus(cap_signal_size, description="Count of events for pad 4")
+        The hardware will count how many times the touchpad discharges within this sample
+        period and reflect that value in the corresponding `count` register.  Each count
+        is {} bits wide and saturates rather than wrapping, so short periods give lower
+        press latency, while long periods need wide enough counts to avoid saturating.""".format(cap_signal_size), reset=period)
+        cper = self.cper.storage
+
+        self.cpress = CSRStorage(npads * cap_signal_size, description="Count thresholds for triggering a ``press`` event",
+                                 fields=_pad_fields("p", npads, "Press threshold for pad {}", size=cap_signal_size, reset=0x0a))
+        self.crel   = CSRStorage(npads * cap_signal_size, description="Count thresholds for triggering a ``release`` event",
+                                 fields=_pad_fields("r", npads, "Release threshold for pad {}", size=cap_signal_size, reset=0x03))
+
+        if debugging:
+            for n in range(1, npads + 1):
+                setattr(self, "c{}".format(n), CSRStatus(cap_signal_size, name="c{}".format(n),
+                                                         description="Count of events for pad {}".format(n)))
 
         cap_count = Signal(cap_count_len)
-        cap1_count = Signal(cap_signal_size)
-        cap2_count = Signal(cap_signal_size)
-        cap3_count = Signal(cap_signal_size)
-        cap4_count = Signal(cap_signal_size)
+
+        # Each lane is one counter, along with the filter, baseline and schmitt
+        # trigger that process its count.  Normally every pad has its own lane.
+        # When scanning, a single lane measures one pad per period, and the
+        # per-pad state of each stage is selected by `scan_pad`.
+        if scan:
+            self.scan_doc = ModuleDoc("""Pad Scanning
+
+            To save logic, this block was built with a single counter, filter, baseline
+            and schmitt trigger that are shared between the pads.  Each ``CPER`` period
+            measures one pad, moving on to the next pad at the end of the period, so a
+            complete sample takes {} periods.  The counts and ``CSTAT`` bits of each pad
+            are held back until all of the pads have been measured, and are then passed
+            to the count registers, sample FIFO and snapshot together with the new sequence
+            number, so that every sample comes from a single scan.  The ``CSTAT`` register
+            itself is updated as each pad is measured.
+
+            Every pad keeps its own thresholds and state, and the registers behave as
+            they do when each pad has its own counter.  Only the rate at which each pad
+            is sampled changes.  Since each pad is counted for a single period, shorten
+            ``CPER`` to sample each pad more often, at the cost of lower counts.
+            """.format(npads))
+            scan_pad = Signal(max=npads)
+            counts = [Signal(cap_signal_size)]
+            lanes = [scan_pad]
+        else:
+            counts = [Signal(cap_signal_size) for _ in ios]
+            lanes = list(range(npads))
+
+        # Counts from the most recent complete sample period.  These are
+        # latched at the end of every period, along with `cstat`.
+        sample_counts = [Signal(cap_signal_size) for _ in ios]
+        sample = Signal()
+        # `CSTAT` as of the most recent complete sample.  When scanning this is
+        # a copy, as `CSTAT` changes one pad at a time.
+        sample_cstat = Signal(npads) if scan else self.cstat.status
+
+        # The value each lane's schmitt trigger compares against its thresholds
+        levels = [Signal(cap_signal_size) for _ in lanes]
+        pressed = [getattr(self.cstat.fields, "s{}".format(n)) for n in range(1, npads + 1)]
+        # High at the end of every complete measurement period.  The period that
+        # ends straight out of reset has not counted anything, so it is skipped.
+        tick = Signal()
+        started = Signal()
+        # High once every pad has been measured, which is on every tick unless
+        # the pads are being scanned.
+        sample_tick = Signal()
+        # Number of complete sample periods, and the clock cycle on which the
+        # most recent one ended.  Both wrap around.
+        self.sequence = sequence = Signal(16)
+        self.timestamp = timestamp = Signal(32)
+        cycles = Signal(32)
+
+        # Fields are placed at fixed offsets so that they are in the same place
+        # regardless of which processing stages are built.
+        ctrl_fields = []
+        if baseline:
+            ctrl_fields.append(CSRField("baseline", reset=1, description="Apply thresholds to the count minus the tracked baseline"))
+        if filtering:
+            ctrl_fields.append(CSRField("fshift", size=3, offset=4, reset=filter_shift, description="""
+                Strength of the count filter.  Each sample period the filtered count moves
+                1/2^``FSHIFT`` of the way towards the new count, so ``0`` disables filtering."""))
+        if baseline:
+            ctrl_fields.append(CSRField("brate", size=8, offset=8, reset=15, description="Number of sample periods between baseline updates, minus one"))
+            ctrl_fields.append(CSRField("bhold", size=8, offset=16, reset=255, description="Number of baseline updates that a pressed pad's baseline is frozen for"))
+        if ctrl_fields:
+            self.ctrl = CSRStorage(fields=ctrl_fields, description="Control for the count processing")
+
+        values = counts
+        if filtering:
+            values = self.add_filter(counts, lanes, tick)
+        if baseline:
+            self.add_baseline(values, lanes, levels, pressed, tick, sample_tick)
+        else:
+            self.comb += [level.eq(value) for level, value in zip(levels, values)]
 
         self.submodules.ev = ev.EventManager()
         self.ev.submodules.touch = ev.EventSourcePulse(name="touch", description="""
             Indicates a touch event such as a "press" or "release" has occurred.""")
+        # Event sources for the gesture decoder, which is added by `add_slider()`
+        if slider:
+            self.ev.submodules.swipe = ev.EventSourcePulse(name="swipe", description="""
+                A finger was slid along the pads and lifted.  ``SLIDER.DIR`` gives its direction.""")
+            self.ev.submodules.tap = ev.EventSourcePulse(name="tap", description="""
+                A finger briefly touched the pads without sliding along them.""")
+            self.ev.submodules.dtap = ev.EventSourcePulse(name="dtap", description="""
+                A tap followed a previous tap within ``SLCTRL.GAP`` sample periods.""")
         self.ev.finalize()
 
         ar = []
         syn = []
         cmb = []
-        for num, pad in enumerate(ios, start=1):
-            print("touch{}".format(num))
+        discharging = [Signal() for _ in ios]
+        for n, pad in enumerate(ios, start=1):
             if debugging:
-                exec("ar.append(self.c{}.status.eq(cap{}_count))".format(num, num))
-            exec("ar.append(cap{}_count.eq(0))".format(num))
+                cmb.append(getattr(self, "c{}".format(n)).status.eq(sample_counts[n-1]))
+            cmb += [
+                discharging[n-1].eq(getattr(self.capen.fields, "t{}".format(n)) & ~pad.i),
+                pad.o.eq(getattr(self.o.fields, "o{}".format(n)) | getattr(self.capen.fields, "t{}".format(n))),
+                getattr(self.i.fields, "i{}".format(n)).eq(pad.i),
+            ]
+            syn.append(pad.oe.eq(getattr(self.oe.fields, "oe{}".format(n)) | discharging[n-1]))
 
-            # Implement a schmitt trigger in Verilog
-            # 1: Value is 1 and count > crel OR value is 0 and count > cpress
-            # 0: Value is 1 and count < crel OR value is 0 and count < cpress
-            exec("""ar.append(self.cstat.fields.s{}.eq(
-                    (self.cstat.fields.s{} & wrap(cap{}_count > crel)) |
-                    (~self.cstat.fields.s{} & wrap(cap{}_count > cpress))))""".format(num, num, num, num, num))
+        # Counters saturate rather than wrapping
+        if scan:
+            # Each pad's count is staged here until the whole scan is done
+            shadow_counts = [Signal(cap_signal_size) for _ in ios]
+            ar += [
+                _lane(shadow_counts, scan_pad).eq(counts[0]),
+                If(scan_pad == npads - 1,
+                    scan_pad.eq(0),
+                ).Else(
+                    scan_pad.eq(scan_pad + 1),
+                ),
+            ]
+            syn.append(If(counts[0] != (2**cap_signal_size - 1), counts[0].eq(counts[0] + _lane(discharging, scan_pad))))
+            self.comb += sample_tick.eq(tick & (scan_pad == npads - 1))
+        else:
+            ar += [sample_count.eq(count) for sample_count, count in zip(sample_counts, counts)]
+            syn += [If(count != (2**cap_signal_size - 1), count.eq(count + d)) for count, d in zip(counts, discharging)]
+            self.comb += sample_tick.eq(tick)
+        ar += [count.eq(0) for count in counts]
 
-            exec("cmb.append(pad.o.eq(self.o.fields.o{} | self.capen.fields.t{}))".format(num, num))
-            exec("cmb.append(self.i.fields.i{}.eq(pad.i))".format(num))
-            exec("syn.append(cap{}_count.eq(cap{}_count + (self.capen.fields.t{} & ~pad.i)))".format(num, num, num))
-            exec("syn.append(pad.oe.eq(self.oe.fields.oe{} | (self.capen.fields.t{} & ~pad.i)))".format(num, num))
+        # Implement a schmitt trigger in Verilog
+        # 1: Value is 1 and level > crel OR value is 0 and level > cpress
+        # 0: Value is 1 and level < crel OR value is 0 and level < cpress
+        crel = [getattr(self.crel.fields, "r{}".format(n)) for n in range(1, npads + 1)]
+        cpress = [getattr(self.cpress.fields, "p{}".format(n)) for n in range(1, npads + 1)]
+        new_states = []
+        for level, lane in zip(levels, lanes):
+            state = _lane(pressed, lane)
+            new_state = Signal()
+            self.comb += new_state.eq(
+                (state & wrap(level > _lane(crel, lane))) |
+                (~state & wrap(level > _lane(cpress, lane))))
+            ar.append(state.eq(new_state))
+            new_states.append(new_state)
+        if scan:
+            # The last pad of the scan is stored straight into the sample,
+            # alongside the staged counts and states of the others.
+            ar.append(If(scan_pad == npads - 1,
+                *[sample_count.eq(shadow) for sample_count, shadow in zip(sample_counts[:-1], shadow_counts[:-1])],
+                sample_counts[-1].eq(counts[0]),
+                sample_cstat.eq(Cat(self.cstat.status[:-1], new_states[0])),
+            ))
 
         # This is used to trigger an interrupt when this value changes
-        last_stat = Signal(4)
+        last_stat = Signal(npads)
 
         self.sync += [
             self.ev.touch.trigger.eq(0),
@@ -137,15 +271,597 @@ class CapTouchPads(Module, AutoCSR):
 
             *syn,
 
+            # Goes high for one cycle once `sample_counts` and `cstat` are valid.
+            # Like `tick`, it skips the empty period that ends out of reset, so
+            # that the FIFO never records it.
+            sample.eq(sample_tick),
+
+            If(cap_count == 0,
+                started.eq(1),
+            ),
+            cycles.eq(cycles + 1),
+            If(sample_tick,
+                sequence.eq(sequence + 1),
+                timestamp.eq(cycles),
+            ),
+
             # Perform a captouch tick
             If(cap_count > 0,
                 cap_count.eq(cap_count - 1),
             ).Else(
                 cap_count.eq(cper),
-                *ar,
+                # Nothing has been counted in the period that ends out of
+                # reset, so it is not stored.
+                If(started,
+                    *ar,
+                ),
             ),
         ]
 
         self.comb += [
+            tick.eq((cap_count == 0) & started),
             *cmb,
         ]
+
+        if mutual:
+            self.add_mutual(ios, discharging, tick, cap_count)
+        if slider:
+            self.add_slider(sample)
+
+        # Slots in the `touch_data` window, indexed by their position in it
+        self.window = {}
+        if fifo_depth is not None:
+            self.add_fifo(fifo_depth, sample_counts, sample_cstat, sample)
+        if event_wait:
+            self.add_event_wait(self.cstat.status ^ last_stat, wait_limit)
+        if snapshot:
+            self.add_snapshot(sample_counts, sample_cstat, sample_tick)
+        if self.window:
+            self.add_window()
+
+    def add_filter(self, counts, lanes, tick, frac=4):
+        self.filter_doc = ModuleDoc("""Count Filtering
+
+        Raw pad counts are noisy from one sample period to the next.  Each count is
+        passed through a first-order IIR filter before it reaches the baseline and
+        threshold logic, so that the press state can be trusted without the host
+        filtering every sample itself.
+
+        Every sample period, the filtered count moves 1/2^``CTRL.FSHIFT`` of the way
+        towards the new raw count.  Larger values give a smoother result but respond
+        more slowly.  ``FILT`` holds the integer part of the most recent filtered
+        count for each pad, alongside the raw counts.
+        """)
+        width = len(counts[0])
+        self.filt = CSRStatus(self.npads * width, fields=[
+            CSRField("f{}".format(n), size=width, description="Filtered count for pad {}".format(n)) for n in range(1, self.npads + 1)
+        ], description="Filtered count for each pad")
+
+        accs = [Signal(width + frac) for _ in range(self.npads)]
+        # The filter is primed with the first count rather than ramping up
+        # from zero, which would look like a press to the baseline stage.
+        primed = [Signal() for _ in range(self.npads)]
+        for n, acc in enumerate(accs, start=1):
+            self.comb += getattr(self.filt.fields, "f{}".format(n)).eq(acc[frac:])
+
+        filtered = []
+        for count, lane in zip(counts, lanes):
+            acc = Signal(width + frac)
+            is_primed = Signal()
+            diff = Signal((width + frac + 1, True))
+            step = Signal((width + frac + 1, True))
+            nxt = Signal(width + frac)
+            self.comb += [
+                acc.eq(_lane(accs, lane)),
+                is_primed.eq(_lane(primed, lane)),
+                diff.eq(Cat(Replicate(0, frac), count) - acc),
+                Case(self.ctrl.fields.fshift, dict(
+                    (i, step.eq(diff >> i)) for i in range(2**len(self.ctrl.fields.fshift))
+                )),
+                If(is_primed,
+                    nxt.eq(acc + step),
+                ).Else(
+                    nxt.eq(Cat(Replicate(0, frac), count)),
+                ),
+            ]
+            self.sync += If(tick,
+                _lane(accs, lane).eq(nxt),
+                _lane(primed, lane).eq(1),
+            )
+            # The filtered count for the period that is just ending.  This is
+            # what the later stages see, so filtering adds no extra latency.
+            filtered.append(nxt[frac:])
+        return filtered
+
+    def add_baseline(self, counts, lanes, levels, pressed, tick, sample_tick, frac=4):
+        self.baseline_doc = ModuleDoc("""Baseline Tracking
+
+        The count that an untouched pad produces drifts with temperature and humidity.
+        To compensate for this, the hardware tracks a baseline for each pad, and the
+        ``CPRESS`` and ``CREL`` thresholds are applied to the amount by which the count
+        exceeds the baseline rather than to the raw count.
+
+        The baseline is a slow IIR filter of the pad count.  Every ``CTRL.BRATE`` + 1
+        sample periods, the baseline moves 1/16 of the way towards the most recent
+        count.  The baseline is frozen while a pad is pressed, so that a long press
+        is not slowly absorbed into the baseline.
+
+        A pad that stays pressed for ``CTRL.BHOLD`` baseline updates is assumed to be
+        stuck, for example because something is resting on it or its count jumped when
+        the board was moved.  Its baseline then resumes tracking the count at the usual
+        rate until the pad is released, after which the next press is frozen again.  With
+        the default ``BRATE`` and ``BHOLD`` this takes 4080 sample periods, or about three
+        minutes at the default sample period.  ``BHOLD`` of ``0`` never freezes the
+        baseline.
+
+        When ``CTRL.BASELINE`` is ``0`` the baseline follows the count directly and the
+        thresholds are applied to the raw count.  The baseline is seeded from the
+        current count as soon as tracking is enabled, including after reset.
+        """)
+        width = len(counts[0])
+        self.base = CSRStatus(self.npads * width, fields=[
+            CSRField("b{}".format(n), size=width, description="Baseline for pad {}".format(n)) for n in range(1, self.npads + 1)
+        ], description="Tracked baseline count for each pad")
+
+        enable = self.ctrl.fields.baseline
+        # The baseline carries `frac` fractional bits so that it can move in
+        # steps smaller than one count.
+        bases = [Signal(width + frac) for _ in range(self.npads)]
+        seeded = [Signal() for _ in range(self.npads)]
+        # Baseline updates that each pad has spent pressed, up to `BHOLD`
+        held = [Signal(8) for _ in range(self.npads)]
+        bhold = self.ctrl.fields.bhold
+        for n, base in enumerate(bases, start=1):
+            self.comb += getattr(self.base.fields, "b{}".format(n)).eq(base[frac:])
+
+        # Counts whole sample periods, so that every pad is updated once when
+        # it reaches zero even if the pads are scanned.
+        divider = Signal(8)
+        self.sync += If(sample_tick,
+            If(divider == 0,
+                divider.eq(self.ctrl.fields.brate),
+            ).Else(
+                divider.eq(divider - 1),
+            ),
+        )
+
+        for count, lane, level in zip(counts, lanes, levels):
+            base = Signal(width + frac)
+            base_int = base[frac:]
+            is_seeded = Signal()
+            is_held = Signal(8)
+            diff = Signal((width + frac + 1, True))
+            self.comb += [
+                base.eq(_lane(bases, lane)),
+                is_seeded.eq(_lane(seeded, lane)),
+                is_held.eq(_lane(held, lane)),
+                diff.eq(Cat(Replicate(0, frac), count) - base),
+                If(~enable,
+                    level.eq(count),
+                ).Elif(is_seeded & (count > base_int),
+                    level.eq(count - base_int),
+                ).Else(
+                    level.eq(0),
+                ),
+            ]
+            self.sync += If(tick,
+                _lane(seeded, lane).eq(enable),
+                If(~is_seeded,
+                    _lane(bases, lane).eq(Cat(Replicate(0, frac), count)),
+                ).Elif((divider == 0) & (~_lane(pressed, lane) | (is_held >= bhold)),
+                    _lane(bases, lane).eq(base + (diff >> frac)),
+                ),
+                If(~_lane(pressed, lane),
+                    _lane(held, lane).eq(0),
+                ).Elif((divider == 0) & (is_held < bhold),
+                    _lane(held, lane).eq(is_held + 1),
+                ),
+            )
+
+    def add_mutual(self, ios, discharging, tick, cap_count):
+        npairs = self.npads // 2
+        # A receiver can discharge at most once per cycle of the period, so the
+        # deltas are sized from `CPER` rather than from the counts.
+        self.delta_width = width = len(self.cper.storage) + 1
+        self.mutual_doc = ModuleDoc("""Mutual Capacitance
+
+        Normally each pad measures its own capacitance to ground.  When ``MCTRL.EN``
+        is ``1``, neighbouring pads are instead used in pairs: pad 1 with pad 2, pad 3
+        with pad 4, and so on, giving {} pairs.  The first pad of each pair is a
+        transmitter, and is driven as a square wave that toggles every ``MCTRL.DIV`` + 1
+        clock cycles.  The second pad is a receiver, and is measured as usual.
+
+        Every edge of the transmitter couples charge into the receiver, so the receiver
+        discharges more often while the transmitter is low than while it is high.
+        ``MDELTA`` holds, for each pair, the number of receiver discharges counted while
+        the transmitter was low minus the number counted while it was high, over the
+        most recent sample period.  A finger near the pair shunts some of that coupling
+        to ground, so a touch makes the delta smaller.
+
+        Every period starts with the transmitters low, and discharges are only counted
+        over whole cycles of the square wave, so both halves are always the same length.
+        If ``CPER`` is not a multiple of 2 * (``MCTRL.DIV`` + 1) cycles, the cycles left
+        over at the end of the period are not counted.
+
+        Noise that reaches the receiver regardless of the transmitter adds to both
+        halves equally and cancels, so a shorter ``CPER`` gives the same signal to noise
+        ratio as a longer period in self capacitance mode.  Each delta is a {}-bit two's
+        complement value, which is wide enough for any period ``CPER`` can be set to.
+        While ``MCTRL.EN`` is ``1``, the counts and ``CSTAT`` bits of the transmitting
+        pads are meaningless.
+        """.format(npairs, width))
+        self.mctrl = CSRStorage(fields=[
+            CSRField("en", description="Measure pairs of pads rather than each pad on its own"),
+            CSRField("div", size=8, offset=8, reset=15, description="Number of clock cycles between transmitter edges, minus one"),
+        ], description="Control for mutual capacitance mode")
+        self.mdelta = CSRStatus(npairs * width, fields=[
+            CSRField("d{}".format(n), size=width, description="Delta for pad {} transmitting to pad {}".format(2*n - 1, 2*n))
+            for n in range(1, npairs + 1)
+        ], description="Receiver discharge count difference for each pair of pads")
+
+        enable = self.mctrl.fields.en
+        div = self.mctrl.fields.div
+        phase = Signal()
+        divider = Signal(8)
+        # Cycles in one whole cycle of the square wave
+        wave = Signal(10)
+        # Cleared for the part of the period too short for another whole wave
+        counting = Signal()
+        self.comb += wave.eq((div + 1) << 1)
+        self.sync += [
+            If(tick | (divider == 0),
+                divider.eq(div),
+            ).Else(
+                divider.eq(divider - 1),
+            ),
+            # Every period starts with the transmitters low, so that the two
+            # halves are the same length.
+            If(tick,
+                phase.eq(0),
+            ).Elif(divider == 0,
+                phase.eq(~phase),
+            ),
+            # Decide at the start of each wave whether all of it fits in the
+            # cycles left before the next tick.
+            If(tick,
+                counting.eq(self.cper.storage >= wave),
+            ).Elif((divider == 0) & phase,
+                counting.eq(cap_count > wave),
+            ),
+        ]
+
+        for n in range(1, npairs + 1):
+            tx = ios[2*n - 2]
+            rx = 2*n - 1
+            delta = Signal((width, True))
+            # The transmitter is driven rather than left to discharge
+            self.comb += If(enable,
+                discharging[2*n - 2].eq(0),
+                tx.o.eq(phase),
+            )
+            self.sync += [
+                If(enable,
+                    tx.oe.eq(1),
+                ),
+                If(tick,
+                    getattr(self.mdelta.fields, "d{}".format(n)).eq(delta),
+                    delta.eq(0),
+                ).Elif(counting & discharging[rx] & ~phase,
+                    delta.eq(delta + 1),
+                ).Elif(counting & discharging[rx] & phase,
+                    delta.eq(delta - 1),
+                ),
+            ]
+
+    def add_slider(self, sample):
+        npads = self.npads
+        positions = 2 * npads - 1
+        self.slider_doc = ModuleDoc("""Slider and Gestures
+
+        The pads are treated as a slider, and presses are decoded into gestures in
+        hardware, so that the host only needs to act when one of the ``SWIPE``, ``TAP``
+        or ``DTAP`` events fires rather than polling the counts.  The decoder runs once
+        per sample period, using ``CSTAT``.
+
+        While any pad is pressed, ``SLIDER.POS`` is the position of the finger in
+        half-pad steps, from ``0`` at pad 1 to ``{}`` at pad {}.  It is the midpoint of
+        the lowest and highest pads that are pressed, so a finger resting between two
+        pads reads as half way between them.  ``SLIDER.TOUCHED`` is ``1`` while any pad
+        is pressed.
+
+        When the finger is lifted, the position it was first pressed at is compared with
+        the last position it was seen at.  If these differ by at least ``SLCTRL.SWIPE``
+        half-pad steps, a ``SWIPE`` event fires and ``SLIDER.DIR`` is set to ``1`` if the
+        finger moved towards pad {}, or ``0`` if it moved towards pad 1.  Otherwise, if
+        the pads were pressed for fewer than ``SLCTRL.TAP`` sample periods, a ``TAP``
+        event fires.  If a tap ends within ``SLCTRL.GAP`` sample periods of the end of
+        the previous tap, ``DTAP`` fires as well, and the next tap starts a new pair.
+        """.format(positions - 1, npads, npads))
+        self.slctrl = CSRStorage(fields=[
+            CSRField("swipe", size=4, reset=2, description="Distance a finger must move, in half-pad steps, to count as a swipe"),
+            CSRField("tap", size=8, offset=8, reset=8, description="Sample periods a press must be shorter than to count as a tap"),
+            CSRField("gap", size=8, offset=16, reset=8, description="Most sample periods between two taps that count as a double tap"),
+        ], description="Gesture decoder control")
+        self.slider = CSRStatus(fields=[
+            CSRField("pos", size=bits_for(positions - 1), description="Position of the finger, in half-pad steps from pad 1"),
+            CSRField("touched", offset=8, description="A pad is being pressed, and ``POS`` is valid"),
+            CSRField("dir", offset=9, description="Direction of the most recent swipe.  ``1`` is towards the last pad."),
+        ], description="Slider position and gesture state")
+
+        cstat = self.cstat.status
+        touched = cstat != 0
+        # The lowest and highest pressed pads.  Later assignments win, so
+        # `first` ends up as the lowest and `last` as the highest.
+        first = Signal(max=npads)
+        last = Signal(max=npads)
+        pos = Signal(max=positions)
+        self.comb += [
+            *[If(cstat[n], first.eq(n)) for n in reversed(range(npads))],
+            *[If(cstat[n], last.eq(n)) for n in range(npads)],
+            pos.eq(first + last),
+        ]
+
+        was_touched = Signal()
+        start_pos = Signal(max=positions)
+        distance = Signal((len(pos) + 1, True))
+        # Sample periods the current press has lasted, and since the end of the
+        # most recent tap.  Both saturate.
+        duration = Signal(8)
+        since_tap = Signal(8)
+        tap_armed = Signal()
+        self.comb += [
+            distance.eq(self.slider.fields.pos - start_pos),
+            self.slider.fields.touched.eq(was_touched),
+        ]
+
+        self.sync += [
+            self.ev.swipe.trigger.eq(0),
+            self.ev.tap.trigger.eq(0),
+            self.ev.dtap.trigger.eq(0),
+            If(sample,
+                was_touched.eq(touched),
+                If(since_tap != 0xff,
+                    since_tap.eq(since_tap + 1),
+                ),
+                If(touched,
+                    self.slider.fields.pos.eq(pos),
+                    If(~was_touched,
+                        start_pos.eq(pos),
+                        duration.eq(0),
+                    ).Elif(duration != 0xff,
+                        duration.eq(duration + 1),
+                    ),
+                ).Elif(was_touched,
+                    If((distance >= self.slctrl.fields.swipe) | (-distance >= self.slctrl.fields.swipe),
+                        self.ev.swipe.trigger.eq(1),
+                        self.slider.fields.dir.eq(distance > 0),
+                    ).Elif(duration < self.slctrl.fields.tap,
+                        self.ev.tap.trigger.eq(1),
+                        since_tap.eq(0),
+                        If(tap_armed & (since_tap <= self.slctrl.fields.gap),
+                            self.ev.dtap.trigger.eq(1),
+                            tap_armed.eq(0),
+                        ).Else(
+                            tap_armed.eq(1),
+                        ),
+                    ),
+                ),
+            ),
+        ]
+
+    def add_fifo(self, depth, sample_counts, sample_cstat, sample):
+        sample_data = Cat(*sample_counts, sample_cstat, self.sequence, self.timestamp)
+
+        self.fifo_doc = ModuleDoc("""Sample FIFO
+
+        At the end of every sample period, the count for each pad is latched into
+        the sample FIFO along with the value of ``CSTAT``.  This allows the host
+        to read out many sample periods at once rather than having to poll faster
+        than the sample rate.
+
+        The FIFO is read out through the ``touch_data`` memory window rather than
+        through a CSR, so that each sample can be read with full-width bus accesses.
+        Each entry occupies {words} consecutive 32-bit words starting at offset
+        ``0x00`` of the window.  Pad counts are packed starting from bit 0 of the
+        first word, {width} bits per pad, followed by the {npads} ``CSTAT`` bits, a 16-bit
+        sequence number and a 32-bit timestamp.  Bit 31 of the last word is set if the
+        entry is valid, and is ``0`` if the FIFO was empty when it was read.
+
+        The sequence number increments at the end of every sample period, and the
+        timestamp is the value of a free-running clock cycle counter when the period
+        ended.  Both wrap around.  A gap in the sequence numbers means that samples
+        were dropped, and the timestamps give the exact time between samples.
+
+        Reading the first word of an entry latches the whole entry, and reading the
+        last word removes it from the FIFO, so a host may drain the FIFO by reading
+        the same {words} words over and over again.  An entry is only removed if it
+        was valid when it was latched, so a sample that arrives part way through a
+        read of an empty FIFO is kept for the next read.  ``FIFO_LEVEL`` indicates how
+        many entries are ready to be read.  If a sample period ends while the FIFO is
+        full, the sample is dropped and ``FIFO_STAT.OVERFLOW`` is set.
+
+        The period that ends on the first cycle after reset has not counted anything,
+        so it is not recorded.  The first entry is always a complete sample period.
+        """.format(words=(len(sample_data) + 1 + 31) // 32, width=len(sample_counts[0]), npads=self.npads))
+
+        self.fifo_ctrl = CSRStorage(fields=[
+            CSRField("en", reset=1, description="Latch each sample into the FIFO at the end of its sample period"),
+            CSRField("clear", pulse=True, description="Write ``1`` to empty the FIFO and clear ``FIFO_STAT.OVERFLOW``"),
+        ], description="Sample FIFO control")
+        self.fifo_stat = CSRStatus(fields=[
+            CSRField("overflow", description="A sample was dropped because the FIFO was full"),
+        ], description="Sample FIFO status")
+
+        self.submodules.fifo = fifo = ResetInserter()(SyncFIFOBuffered(len(sample_data), depth))
+        self.fifo_level = CSRStatus(len(fifo.level), description="Number of samples waiting in the FIFO")
+
+        overflow = Signal()
+        self.comb += [
+            fifo.reset.eq(self.fifo_ctrl.fields.clear),
+            fifo.din.eq(sample_data),
+            fifo.we.eq(sample & self.fifo_ctrl.fields.en),
+            self.fifo_level.status.eq(fifo.level),
+            self.fifo_stat.fields.overflow.eq(overflow),
+        ]
+        self.sync += [
+            If(self.fifo_ctrl.fields.clear,
+                overflow.eq(0),
+            ).Elif(fifo.we & ~fifo.writable,
+                overflow.eq(1),
+            )
+        ]
+
+        # The top bit of the last word indicates whether the entry is valid.
+        self.window[0] = slot = _WindowSlot(fifo.dout, fifo.readable)
+        # The slot's words hold the latched entry until the read completes, so
+        # this is the valid bit the host was given.
+        self.comb += fifo.re.eq(slot.done & slot.words[-1][31])
+
+    def add_event_wait(self, changed, wait_limit):
+        self.event_doc = ModuleDoc("""Blocking Event Reads
+
+        Rather than polling ``EV_PENDING`` over the bridge, a host may read the
+        word at offset ``0x40`` of the ``touch_data`` window.  The bus transaction
+        does not complete until a pad has been pressed or released, so the host
+        simply blocks in its read until something happens.
+
+        The word contains the current ``CSTAT`` value in bits 0-{last}, and a mask of
+        the pads that changed state since the previous read in bits {npads}-{last_changed}.
+        Bits {press}-{last_press} hold a mask of the pads that were pressed since the
+        previous read, and bits {release}-{last_release} a mask of the pads that were
+        released.  These are latched separately, so a pad that was pressed and released
+        again between two reads has both bits set, and a single read tells the host
+        every edge that occurred without comparing ``CSTAT`` against an older copy.
+        Bit 31 of the last word is set if an event occurred.
+
+        With more than seven pads the masks no longer fit in one word, and the slot
+        spans {nwords} words.  Only the read of the first word waits for an event, and it
+        latches the whole slot.  The remaining words return the latched values at once
+        until the last word is read, so every word describes the same moment.  Reading the last word clears the edges that were
+        latched, and any that arrived during the read are returned by the next one.
+
+        To avoid stalling the bridge forever, the read completes with bit 31
+        cleared once ``WAIT_TIMEOUT`` clock cycles have passed without an event.
+        The SoC's bus gives up on a read after 1,000,000 cycles and returns all ones,
+        which would look like an event on every pad, so the wait is limited to
+        {limit} cycles.  Larger values of ``WAIT_TIMEOUT``, and ``0``, wait for
+        {limit} cycles.
+        """.format(limit=wait_limit, last=self.npads - 1, npads=self.npads, last_changed=2 * self.npads - 1,
+                   press=2 * self.npads, last_press=3 * self.npads - 1,
+                   release=3 * self.npads, last_release=4 * self.npads - 1,
+                   nwords=(4 * self.npads + 1 + 31) // 32))
+        self.wait_timeout = CSRStorage(32, reset=600000, description="""
+            Number of clock cycles a read of the event word waits for an event before
+            completing anyway, up to {}.  The default is 50 ms at 12 MHz.""".format(wait_limit))
+
+        # Changed, pressed and released masks, each with one bit per pad.  A
+        # changed pad that is now set in `CSTAT` has just been pressed.
+        edges = Signal(3 * len(changed))
+        pending = Signal(len(edges))
+        reported = Signal(len(edges))
+        timer = Signal(32)
+        timed_out = Signal()
+        # `WAIT_TIMEOUT`, clamped to the longest wait the bus allows
+        timeout = Signal(32)
+
+        self.window[1] = slot = _WindowSlot(Cat(self.cstat.status, pending), pending != 0,
+                                            ready=(pending != 0) | timed_out)
+        self.comb += [
+            edges.eq(Cat(changed, changed & self.cstat.status, changed & ~self.cstat.status)),
+            If((self.wait_timeout.storage == 0) | (self.wait_timeout.storage > wait_limit),
+                timeout.eq(wait_limit),
+            ).Else(
+                timeout.eq(self.wait_timeout.storage),
+            ),
+            timed_out.eq(timer >= timeout),
+        ]
+        # Only clear the changes that were latched as the first word was
+        # returned, in case another change arrives before the read completes.
+        self.sync += [
+            If(slot.start,
+                reported.eq(pending),
+            ),
+            If(slot.done,
+                pending.eq((pending & ~reported) | edges),
+            ).Else(
+                pending.eq(pending | edges),
+            ),
+            If(slot.selected,
+                timer.eq(timer + 1),
+            ).Else(
+                timer.eq(0),
+            ),
+        ]
+
+    def add_snapshot(self, sample_counts, sample_cstat, tick):
+        # Pending bits are padded to four so that `sequence` and `timestamp` do
+        # not move as event sources are added.
+        sources = [self.ev.touch]
+        if hasattr(self.ev, "swipe"):
+            sources += [self.ev.swipe, self.ev.tap, self.ev.dtap]
+        pending = [source.pending for source in sources]
+        if len(sources) < 4:
+            pending.append(Replicate(0, 4 - len(sources)))
+        live = Cat(*sample_counts, sample_cstat, *pending, self.sequence, self.timestamp)
+
+        self.snapshot_doc = ModuleDoc("""Coherent Snapshots
+
+        Reading the pad counts, ``CSTAT`` and ``EV_PENDING`` one at a time takes a
+        bus access each, and a sample period may end part way through, leaving the
+        host with values from two different periods.  Instead, the host may read the
+        {words} words at offset ``0x80`` of the ``touch_data`` window, which hold every
+        value from a single sample period.
+
+        Pad counts are packed starting from bit 0 of the first word, {width} bits per
+        pad, followed by the {npads} ``CSTAT`` bits, four bits of ``EV_PENDING``, and the
+        same 16-bit sequence number and 32-bit timestamp as a FIFO entry.  Comparing
+        sequence numbers between reads shows whether the host missed a period or read
+        the same one twice.  Bit 31 of the last word is set once the first sample
+        period has completed.
+
+        Reading the first word latches the whole snapshot, and the remaining words
+        return the latched values until the last word is read, so words read in
+        order always belong together.
+        """.format(words=(len(live) + 1 + 31) // 32, width=len(sample_counts[0]), npads=self.npads))
+
+        valid = Signal()
+        self.sync += If(tick, valid.eq(1))
+        self.window[2] = _WindowSlot(live, valid)
+
+    def add_window(self):
+        # Each slot occupies 16 words of the window.  Reads of a slot's first
+        # word complete once it is ready, and latch the slot.  Everything else,
+        # including the rest of the slot, is acknowledged immediately.
+        self.bus = bus = wishbone.Interface()
+        word = bus.adr[:4]
+        cases = {}
+        for n, slot in self.window.items():
+            latched = Signal(len(slot.data))
+            held = Signal()
+            self.comb += slot.data.eq(Mux(held & ~slot.start, latched, slot.live))
+            self.sync += [
+                If(slot.start,
+                    latched.eq(slot.live),
+                    held.eq(1),
+                ).Elif(slot.done,
+                    held.eq(0),
+                ),
+            ]
+            self.comb += slot.selected.eq(bus.cyc & bus.stb & ~bus.we & (bus.adr[4:6] == n))
+            cases[n] = If(slot.ready | bus.we | (word != 0),
+                bus.ack.eq(1),
+                Case(word, dict(
+                    [(i, bus.dat_r.eq(w)) for i, w in enumerate(slot.words)] +
+                    [("default", bus.dat_r.eq(0))]
+                )),
+            )
+            self.comb += slot.start.eq(slot.selected & slot.ready & ~bus.ack & (word == 0))
+            self.comb += slot.done.eq(bus.ack & ~bus.we & (bus.adr[4:6] == n) & (word == len(slot.words) - 1))
+        cases["default"] = [bus.ack.eq(1), bus.dat_r.eq(0)]
+
+        self.sync += [
+            bus.ack.eq(0),
+            If(bus.cyc & bus.stb & ~bus.ack,
+                Case(bus.adr[4:6], cases),
+            ),
+        ]
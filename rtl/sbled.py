@@ -1,9 +1,12 @@
-from migen import Module, Signal, If, Instance, ClockSignal
+from functools import reduce
+from operator import or_
+
+from migen import Module, Signal, If, Instance, ClockSignal, Mux, Replicate
 from litex.soc.integration.doc import ModuleDoc
 from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage, CSRField
 
 class SBLED(Module, AutoCSR):
-    def __init__(self, revision, pads):
+    def __init__(self, revision, pads, touch=None):
         rgba_pwm = Signal(3)
 
         self.intro = ModuleDoc("""RGB LED Controller
@@ -50,34 +53,34 @@ class SBLED(Module, AutoCSR):
                 it is possible to manually control the three individual LEDs.""")
 
         ledd_value = Signal(3)
+        # The red, green and blue values, before they are routed to whichever
+        # `SB_RGBA_DRV` channel drives that colour on this revision.
+        color = Signal(3)
+        curren = Signal()
+        rgbleden = Signal()
+        self.comb += [
+            If(self.ctrl.storage[3], color[0].eq(self.raw.storage[0])).Else(color[0].eq(ledd_value[0])),
+            If(self.ctrl.storage[4], color[1].eq(self.raw.storage[1])).Else(color[1].eq(ledd_value[1])),
+            If(self.ctrl.storage[5], color[2].eq(self.raw.storage[2])).Else(color[2].eq(ledd_value[2])),
+            curren.eq(self.ctrl.storage[1]),
+            rgbleden.eq(self.ctrl.storage[2]),
+        ]
+        if touch is not None:
+            self.add_touch(touch, color, curren, rgbleden, ledd_value)
+
         if revision == "pvt" or revision == "dvt":
-            self.comb += [
-                If(self.ctrl.storage[3], rgba_pwm[1].eq(self.raw.storage[0])).Else(rgba_pwm[1].eq(ledd_value[0])),
-                If(self.ctrl.storage[4], rgba_pwm[0].eq(self.raw.storage[1])).Else(rgba_pwm[0].eq(ledd_value[1])),
-                If(self.ctrl.storage[5], rgba_pwm[2].eq(self.raw.storage[2])).Else(rgba_pwm[2].eq(ledd_value[2])),
-            ]
+            channels = [1, 0, 2]
         elif revision == "evt":
-            self.comb += [
-                If(self.ctrl.storage[3], rgba_pwm[1].eq(self.raw.storage[0])).Else(rgba_pwm[1].eq(ledd_value[0])),
-                If(self.ctrl.storage[4], rgba_pwm[2].eq(self.raw.storage[1])).Else(rgba_pwm[2].eq(ledd_value[1])),
-                If(self.ctrl.storage[5], rgba_pwm[0].eq(self.raw.storage[2])).Else(rgba_pwm[0].eq(ledd_value[2])),
-            ]
+            channels = [1, 2, 0]
         elif revision == "hacker":
-            self.comb += [
-                If(self.ctrl.storage[3], rgba_pwm[2].eq(self.raw.storage[0])).Else(rgba_pwm[2].eq(ledd_value[0])),
-                If(self.ctrl.storage[4], rgba_pwm[1].eq(self.raw.storage[1])).Else(rgba_pwm[1].eq(ledd_value[1])),
-                If(self.ctrl.storage[5], rgba_pwm[0].eq(self.raw.storage[2])).Else(rgba_pwm[0].eq(ledd_value[2])),
-            ]
+            channels = [2, 1, 0]
         else:
-            self.comb += [
-                If(self.ctrl.storage[3], rgba_pwm[0].eq(self.raw.storage[0])).Else(rgba_pwm[0].eq(ledd_value[0])),
-                If(self.ctrl.storage[4], rgba_pwm[1].eq(self.raw.storage[1])).Else(rgba_pwm[1].eq(ledd_value[1])),
-                If(self.ctrl.storage[5], rgba_pwm[2].eq(self.raw.storage[2])).Else(rgba_pwm[2].eq(ledd_value[2])),
-            ]
+            channels = [0, 1, 2]
+        self.comb += [rgba_pwm[channel].eq(color[n]) for n, channel in enumerate(channels)]
 
         self.specials += Instance("SB_RGBA_DRV",
-            i_CURREN = self.ctrl.storage[1],
-            i_RGBLEDEN = self.ctrl.storage[2],
+            i_CURREN = curren,
+            i_RGBLEDEN = rgbleden,
             i_RGB0PWM = rgba_pwm[0],
             i_RGB1PWM = rgba_pwm[1],
             i_RGB2PWM = rgba_pwm[2],
@@ -114,3 +117,46 @@ class SBLED(Module, AutoCSR):
             o_PWMOUT2 = ledd_value[2],
             o_LEDDON = Signal(),
         )
+
+    def add_touch(self, touch, color, curren, rgbleden, ledd_value):
+        npads = len(touch)
+        self.touch_doc = ModuleDoc("""Touch Feedback
+
+                The LED may be driven straight from the state of the {} touch pads, so that
+                a press shows up on the LED within a clock cycle of ``CSTAT`` changing,
+                without the host reading the pads and writing ``RAW`` over the bridge.
+
+                While ``TOUCH_CTRL.EN`` is ``1`` and any pad is pressed, the LED shows the
+                colours from ``TOUCH_MAP`` of every pressed pad ORed together, overriding
+                ``RAW`` and the fading pattern.  The current source and PWM logic are enabled
+                regardless of ``CTRL``.  When no pad is pressed, the LED behaves as set up
+                through ``CTRL``.
+
+                Set ``TOUCH_CTRL.FADE`` to show the ``SB_LEDDA_IP`` fading pattern in the
+                mapped colour rather than a solid colour.  The pattern must first be set up
+                through ``DAT``, ``ADDR`` and ``CTRL.EXE``.
+                """.format(npads))
+        self.touch_ctrl = CSRStorage(fields=[
+            CSRField("en", description="Set this to ``1`` to light the LED while a touch pad is pressed."),
+            CSRField("fade", description="Set this to ``1`` to show the fading pattern in the mapped colour, rather than a solid colour."),
+        ], description="Control for driving the LED from the touch pads.")
+        # Pads cycle through red, green, blue and white by default
+        defaults = [0b001, 0b010, 0b100, 0b111]
+        self.touch_map = CSRStorage(3 * npads, fields=[
+            CSRField("p{}".format(n), size=3, reset=defaults[(n - 1) % len(defaults)],
+                     description="Colour shown while pad {} is pressed.  Bit 0 is red, bit 1 is green and bit 2 is blue.".format(n))
+            for n in range(1, npads + 1)
+        ], description="The colour that each touch pad lights the LED with.")
+
+        touch_color = Signal(3)
+        active = Signal()
+        self.comb += [
+            touch_color.eq(reduce(or_, [Replicate(touch[n], 3) & getattr(self.touch_map.fields, "p{}".format(n + 1))
+                                        for n in range(npads)])),
+            active.eq(self.touch_ctrl.fields.en & (touch != 0)),
+            If(active,
+                color.eq(Mux(self.touch_ctrl.fields.fade, touch_color & ledd_value, touch_color)),
+                curren.eq(1),
+                rgbleden.eq(1),
+            ),
+        ]
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts at the top of the repository import lxbuildenv, which re-executes
+# the interpreter unless it has already been run.  Let them be imported as they
+# are.
+os.environ.setdefault("LXBUILDENV_REEXEC", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
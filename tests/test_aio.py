@@ -0,0 +1,25 @@
+import asyncio
+
+from captouch.aio import AsyncTouchPads
+
+class DelayedPads(AsyncTouchPads):
+    """Answers every snapshot after `delay` seconds, without a bridge"""
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def snapshot(self):
+        await asyncio.sleep(self.delay)
+        return object()
+
+def test_stream_timestamps_replies():
+    async def run():
+        stream = DelayedPads(0.01).stream(depth=2)
+        first = await stream.__anext__()
+        # A slow consumer must not make the reply that was already in
+        # flight look late.
+        await asyncio.sleep(0.2)
+        second = await stream.__anext__()
+        await stream.aclose()
+        return second.timestamp - first.timestamp
+
+    assert asyncio.run(run()) < 0.1
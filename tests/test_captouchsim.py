@@ -0,0 +1,103 @@
+import pytest
+
+pytest.importorskip("migen")
+pytest.importorskip("litex")
+
+import captouchsim
+
+def test_press_and_release():
+    # Pad 1 is held from period 3 until period 7, and every other pad is idle.
+    # An idle pad counts about 100 and a touched one about 140.
+    profile = captouchsim.TouchProfile().press(1, 3, 7)
+    report = captouchsim.simulate(profile, 10, period=500,
+                                  registers={"cpress": 0x78787878, "crel": 0x6e6e6e6e})
+    cstat = [value for _, _, value in report.samples]
+
+    assert cstat == [0, 0, 0, 1, 1, 1, 1, 0, 0, 0]
+    assert [pressed for _, _, pressed, _ in report.latencies(profile)] == [True, False]
+    assert all(latency is not None for _, _, _, latency in report.latencies(profile))
+
+def test_scan_samples_every_pad():
+    # Every FIFO entry, including the first, holds a count from each pad
+    from migen.sim import run_simulation, passive
+
+    period = 100
+    dut = captouchsim.CapTouchSim(period=period, scan=True, fifo_depth=4)
+    fragment, tristates = dut.get_sim_fragment()
+    models = [captouchsim.PadModel() for _ in tristates]
+    fifo = dut.touch.fifo
+    entries = []
+
+    @passive
+    def pads():
+        while True:
+            for model, ts in zip(models, tristates):
+                yield ts.i.eq(model.step((yield ts.o), (yield ts.oe), 0.0, 0))
+            yield
+
+    def control():
+        yield from dut.csr_write("capen", 0xf)
+        for _ in range(3 * 4 * (period + 1)):
+            if (yield fifo.we) and (yield fifo.writable):
+                entries.append((yield fifo.din))
+            yield
+
+    run_simulation(fragment, [pads(), control()])
+    counts = [[(entry >> (8 * n)) & 0xff for n in range(4)] for entry in entries]
+    assert len(counts) == 3
+    assert all(count == counts[0][0] != 0 for entry in counts for count in entry)
+
+def test_multi_word_event_slot():
+    # With eight pads the event slot spans two words.  Only the first word
+    # waits for an event, and the second is returned from the latched slot.
+    from migen.sim import run_simulation, passive
+    from captouch.touch import TouchEvent, decode_event
+
+    dut = captouchsim.CapTouchSim(npads=8, period=100, event_wait=True)
+    fragment, tristates = dut.get_sim_fragment()
+    models = [captouchsim.PadModel() for _ in tristates]
+    bus = dut.touch.bus
+    reads = []
+
+    @passive
+    def pads():
+        while True:
+            for model, ts in zip(models, tristates):
+                yield ts.i.eq(model.step((yield ts.o), (yield ts.oe), 0.0, 0))
+            yield
+
+    def read(adr):
+        yield bus.adr.eq(adr)
+        yield bus.we.eq(0)
+        yield bus.cyc.eq(1)
+        yield bus.stb.eq(1)
+        cycles = 1
+        yield
+        while not (yield bus.ack):
+            cycles += 1
+            yield
+        value = yield bus.dat_r
+        yield bus.cyc.eq(0)
+        yield bus.stb.eq(0)
+        yield
+        return value, cycles
+
+    def control():
+        yield from dut.csr_write("wait_timeout", 300)
+        # With thresholds of 0 every pad reads as pressed after the first sample
+        yield from dut.csr_write("capen", 0xff)
+        for _ in range(2):
+            words = []
+            for word in range(2):
+                words.append((yield from read(0x10 + word)))
+            reads.append(words)
+
+    run_simulation(fragment, [pads(), control()])
+    (first, first_cycles), (second, second_cycles) = reads[0]
+    assert decode_event([first, second], npads=8) == TouchEvent(0xff, 0xff, 0xff, 0x00)
+    assert second_cycles <= 2
+
+    (first, first_cycles), (second, second_cycles) = reads[1]
+    assert decode_event([first, second], npads=8) is None
+    assert first_cycles >= 300
+    assert second_cycles <= 2
@@ -0,0 +1,115 @@
+import ast
+import struct
+
+import pytest
+
+from captouch.recorder import (HEADER_LEN, MAGIC, Recorder, SampleLog, log_paths, open_log,
+                               record, record_struct)
+from captouch.touch import Sample
+
+SAMPLES = [
+    Sample(1, 1000, (10, 20, 30, 40), 0x1, None),
+    Sample(2, 2000, (11, 21, 31, 41), 0x3, None),
+    Sample(3, 3000, (12, 22, 32, 42), 0x0, None),
+]
+
+def write_log(directory):
+    with Recorder(str(directory), 4, 8) as recorder:
+        for n, sample in enumerate(SAMPLES):
+            recorder.add(100.0 + n, sample)
+    return log_paths(str(directory))
+
+def test_header_and_records(tmp_path):
+    paths = write_log(tmp_path)
+    assert len(paths) == 1
+    with open(paths[0], "rb") as f:
+        data = f.read()
+
+    assert data[:len(MAGIC)] == MAGIC
+    header_len = struct.unpack("<H", data[len(MAGIC) + 2:len(MAGIC) + 4])[0]
+    assert len(MAGIC) + 4 + header_len == HEADER_LEN
+    header = ast.literal_eval(data[len(MAGIC) + 4:HEADER_LEN].decode("latin1"))
+    assert header["shape"] == (len(SAMPLES),)
+
+    record = record_struct(4, 8)
+    records = list(record.iter_unpack(data[HEADER_LEN:]))
+    assert records == [(100.0 + n, s.sequence, s.timestamp, s.cstat, *s.counts)
+                       for n, s in enumerate(SAMPLES)]
+
+def test_open_log(tmp_path):
+    pytest.importorskip("numpy")
+    log = open_log(write_log(tmp_path)[0])
+
+    assert len(log) == len(SAMPLES)
+    assert list(log["sequence"]) == [s.sequence for s in SAMPLES]
+    assert list(log["timestamp"]) == [s.timestamp for s in SAMPLES]
+    assert list(log["cstat"]) == [s.cstat for s in SAMPLES]
+    assert [tuple(counts) for counts in log["counts"]] == [s.counts for s in SAMPLES]
+    assert list(log["host_time"]) == [100.0, 101.0, 102.0]
+
+def test_existing_log_is_kept(tmp_path):
+    path = tmp_path / "existing.npy"
+    path.write_bytes(b"keep")
+    with pytest.raises(FileExistsError):
+        SampleLog(str(path), 4, 8)
+    assert path.read_bytes() == b"keep"
+
+class FifoPads:
+    """Stands in for `TouchPads`, returning one batch of samples per drain"""
+    data_base = 0
+    registers = {"fifo_level": None}
+    clk_freq = 1000
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def drain(self):
+        if not self.batches:
+            raise KeyboardInterrupt
+        return self.batches.pop(0)
+
+class ListRecorder:
+    def __init__(self):
+        self.records = []
+
+    def add(self, host_time, sample):
+        self.records.append((host_time, sample))
+
+def test_record_times_and_gaps(capsys):
+    pads = FifoPads([SAMPLES, [Sample(6, 6000, (0, 0, 0, 0), 0, None)]])
+    recorder = ListRecorder()
+    with pytest.raises(KeyboardInterrupt):
+        record(pads, recorder, 0)
+
+    # Samples from one drain are spaced by their timestamps, ending at the
+    # newest one.
+    times = [host_time for host_time, _ in recorder.records]
+    assert times[1] - times[0] == pytest.approx(1.0)
+    assert times[2] - times[1] == pytest.approx(1.0)
+    assert "dropped 2 sample periods before sequence 6" in capsys.readouterr().err
+
+class SnapshotPads:
+    """Stands in for `TouchPads` built without the FIFO, returning one
+    snapshot slot read per call"""
+    data_base = 0
+    registers = {}
+    clk_freq = 1000
+
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def sample(self):
+        if not self.samples:
+            raise KeyboardInterrupt
+        return self.samples.pop(0)
+
+def test_record_snapshot_slot(capsys):
+    # The first read is before any period has ended, and the third reads the
+    # same period again.
+    pads = SnapshotPads([None, SAMPLES[0], SAMPLES[0], SAMPLES[2]])
+    recorder = ListRecorder()
+    with pytest.raises(KeyboardInterrupt):
+        record(pads, recorder, 0)
+
+    assert [sample for _, sample in recorder.records] == [SAMPLES[0], SAMPLES[2]]
+    assert "dropped 1 sample periods before sequence 3" in capsys.readouterr().err
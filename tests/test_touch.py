@@ -0,0 +1,12 @@
+from captouch.touch import TouchEvent, decode_event
+
+def test_decode_event():
+    # Pad 2 was pressed, and pad 1 pressed and released again
+    word = 0x80000000 | (0x2 << 0) | (0x3 << 4) | (0x3 << 8) | (0x1 << 12)
+    assert decode_event(word) == TouchEvent(0x2, 0x3, 0x3, 0x1)
+    assert decode_event(0x00000002) is None
+
+def test_decode_event_bus_timeout():
+    # The bus returns all ones when it gives up on a read
+    assert decode_event(0xffffffff) is None
+    assert decode_event([0xffffffff, 0xffffffff], npads=8) is None
@@ -0,0 +1,229 @@
+"""Helpers for running the icestorm toolchain outside of LiteX
+
+`Builder.build(run=False)` writes the gateware sources along with a
+`build_<name>.sh` script containing the yosys, nextpnr and icepack commands
+set up in `BaseSoC.__init__`.  These helpers run those same commands, but
+split them up so that steps can be repeated or run in parallel.
+"""
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+_FMAX_RE = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz \((?:PASS|FAIL) at ([\d.]+) MHz\)")
+_UTIL_RE = re.compile(r"^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", re.MULTILINE)
+# Older yosys prints the cell type before the count, newer yosys after it
+_CELL_RE = re.compile(r"^\s+(?:(SB_\w+)\s+(\d+)|(\d+)\s+(SB_\w+))\s*$", re.MULTILINE)
+
+class PnrResult(namedtuple("PnrResult", ["seed", "returncode", "fmax", "utilization", "asc", "log"])):
+    """The outcome of one nextpnr run.
+
+    `fmax` maps each clock to its `(achieved, target)` frequency in MHz, and
+    `utilization` maps each cell type to its `(used, available)` count.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and bool(self.fmax)
+
+    @property
+    def slack(self):
+        """The worst ratio of achieved to target frequency over every clock"""
+        if not self.fmax:
+            return 0
+        return min(achieved / target for achieved, target in self.fmax.values())
+
+def parse_nextpnr_log(log):
+    """Return the final Fmax and utilization reported in a nextpnr log"""
+    fmax = {}
+    # Fmax is reported after placement and again after routing, so the
+    # last value seen for each clock is the one that counts.
+    for clock, achieved, target in _FMAX_RE.findall(log):
+        fmax[clock] = (float(achieved), float(target))
+    utilization = {}
+    for cell, used, available in _UTIL_RE.findall(log):
+        utilization[cell] = (int(used), int(available))
+    return fmax, utilization
+
+def read_build_script(gateware_dir, build_name="top"):
+    """Return the yosys, nextpnr and icepack commands from the build script
+    written by LiteX."""
+    commands = {}
+    with open(os.path.join(gateware_dir, "build_{}.sh".format(build_name)), "r") as f:
+        for line in f:
+            words = shlex.split(line, comments=True)
+            if words and words[0] in ("yosys", "nextpnr-ice40", "icepack"):
+                commands[words[0]] = words
+    for tool in ("yosys", "nextpnr-ice40", "icepack"):
+        if tool not in commands:
+            raise ValueError("no {} command found in the build script".format(tool))
+    return commands
+
+def _replace_arg(words, flag, value):
+    words = list(words)
+    if flag in words:
+        words[words.index(flag) + 1] = value
+    else:
+        words += [flag, value]
+    return words
+
+def run_pnr(gateware_dir, nextpnr, seed, build_name="top"):
+    """Run the `nextpnr` command with a different seed, writing its output to
+    `<build_name>-seed<seed>.txt` and its log to `<build_name>-seed<seed>.log`"""
+    asc = "{}-seed{}.txt".format(build_name, seed)
+    log = "{}-seed{}.log".format(build_name, seed)
+    cmd = _replace_arg(_replace_arg(nextpnr, "--seed", str(seed)), "--asc", asc)
+    with open(os.path.join(gateware_dir, log), "w") as f:
+        returncode = subprocess.call(cmd, cwd=gateware_dir, stdout=f, stderr=subprocess.STDOUT)
+    with open(os.path.join(gateware_dir, log), "r") as f:
+        fmax, utilization = parse_nextpnr_log(f.read())
+    return PnrResult(seed, returncode, fmax, utilization, asc, log)
+
+def seed_sweep(gateware_dir, seeds, jobs=None, build_name="top"):
+    """Synthesize once, then place and route with every seed in `seeds`.
+
+    Up to `jobs` nextpnr processes run at once, defaulting to one per CPU.
+    The result with the best worst-case Fmax is packed into the usual
+    `<build_name>.bin`.  Returns every `PnrResult`, best first.
+    """
+    commands = read_build_script(gateware_dir, build_name)
+    subprocess.check_call(commands["yosys"], cwd=gateware_dir)
+
+    seeds = list(seeds)
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        results = list(pool.map(lambda seed: run_pnr(gateware_dir, commands["nextpnr-ice40"], seed, build_name), seeds))
+    results.sort(key=lambda r: (r.ok, r.slack), reverse=True)
+
+    best = results[0]
+    if not best.ok:
+        raise RuntimeError("nextpnr failed for every seed, see {}".format(os.path.join(gateware_dir, best.log)))
+    shutil.copyfile(os.path.join(gateware_dir, best.asc), os.path.join(gateware_dir, "{}.txt".format(build_name)))
+    subprocess.check_call(commands["icepack"], cwd=gateware_dir)
+    return results
+
+def parse_yosys_stat(stat):
+    """Return the number of each iCE40 cell type in the output of `stat`"""
+    cells = {}
+    for name, count, count2, name2 in _CELL_RE.findall(stat):
+        cells[name or name2] = int(count or count2)
+    return cells
+
+def synth_cells(verilog, top, options="-abc9"):
+    """Synthesize `verilog` for the iCE40 on its own and return the number
+    of each cell type it uses.  Nothing is placed, so this is much quicker
+    than a full build, and is good for comparing the size of a block."""
+    stat = os.path.splitext(verilog)[0] + ".stat"
+    script = "read_verilog {}; synth_ice40 -top {} {}; tee -q -o {} stat".format(
+        os.path.basename(verilog), top, options, os.path.basename(stat))
+    subprocess.check_call(["yosys", "-q", "-p", script], cwd=os.path.dirname(os.path.abspath(verilog)))
+    with open(stat, "r") as f:
+        return parse_yosys_stat(f.read())
+
+def tool_versions():
+    """Return the version string of each tool, or `None` if it is missing"""
+    versions = {}
+    for tool, flag in (("yosys", "-V"), ("nextpnr-ice40", "--version")):
+        try:
+            output = subprocess.run([tool, flag], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
+            versions[tool] = output.decode(errors="replace").strip()
+        except OSError:
+            versions[tool] = None
+    # icepack has no version flag, so a hash of the program stands in for one
+    versions["icepack"] = None
+    icepack = shutil.which("icepack")
+    if icepack is not None:
+        h = hashlib.sha256()
+        with open(icepack, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+        versions["icepack"] = h.hexdigest()
+    return versions
+
+def build_key(gateware_dir, sources, seeds, build_name="top"):
+    """Hash everything that goes into a bitstream.
+
+    This covers the generated Verilog, constraints and build script, which
+    includes the yosys and nextpnr options, along with any extra source
+    files, the seeds to try and the version of each tool.
+    """
+    h = hashlib.sha256()
+    def add(name, data):
+        h.update("{}:{}:".format(name, len(data)).encode())
+        h.update(data)
+
+    for name in ("{}.v", "{}.pcf", "{}_pre_pack.py", "{}.ys", "build_{}.sh"):
+        path = os.path.join(gateware_dir, name.format(build_name))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                add(os.path.basename(path), f.read())
+    for source in sorted(source[0] for source in sources):
+        with open(source, "rb") as f:
+            add(source, f.read())
+    add("seeds", repr(list(seeds)).encode())
+    for tool, version in sorted(tool_versions().items()):
+        add(tool, repr(version).encode())
+    return h.hexdigest()
+
+class BuildCache:
+    """Toolchain outputs stored under `path`, keyed by `build_key()`"""
+    def __init__(self, path=".build-cache"):
+        self.path = path
+
+    def restore(self, key, gateware_dir):
+        """Copy the cached outputs for `key` into `gateware_dir`.  Returns the
+        saved summary of the build, or `None` if nothing is cached."""
+        entry = os.path.join(self.path, key)
+        if not os.path.isdir(entry):
+            return None
+        for name in os.listdir(entry):
+            if name != "summary.txt":
+                shutil.copyfile(os.path.join(entry, name), os.path.join(gateware_dir, name))
+        with open(os.path.join(entry, "summary.txt"), "r") as f:
+            return f.read()
+
+    def store(self, key, gateware_dir, results, build_name="top"):
+        """Save the bitstream, the yosys report and the log of the winning
+        nextpnr run from `results`."""
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        # Fill in a temporary directory first, so that a concurrent build
+        # never sees a partial entry.
+        tmp = tempfile.mkdtemp(dir=self.path)
+        for name in ("{}.bin".format(build_name), "{}.rpt".format(build_name), results[0].log):
+            path = os.path.join(gateware_dir, name)
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(tmp, name))
+        with open(os.path.join(tmp, "summary.txt"), "w") as f:
+            f.write(format_results(results))
+        try:
+            os.rename(tmp, os.path.join(self.path, key))
+        except OSError:
+            # Another build stored the same key first
+            shutil.rmtree(tmp)
+
+def copy_outputs(src_dir, dst_dir, build_name="top"):
+    """Copy the bitstream, reports and nextpnr logs from one gateware
+    directory into another with identical sources."""
+    for name in os.listdir(src_dir):
+        if (name in ("{}.bin".format(build_name), "{}.rpt".format(build_name))
+                or (name.startswith("{}-seed".format(build_name)) and name.endswith(".log"))):
+            shutil.copyfile(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+
+def format_results(results):
+    lines = []
+    for result in results:
+        if not result.ok:
+            lines.append("seed {:5}: failed (see {})".format(result.seed, result.log))
+            continue
+        fmax = ", ".join("{} {:.2f}/{:.2f} MHz".format(clock, achieved, target)
+                         for clock, (achieved, target) in sorted(result.fmax.items()))
+        lc = result.utilization.get("ICESTORM_LC")
+        lines.append("seed {:5}: {}{}".format(result.seed, fmax,
+            "" if lc is None else ", {}/{} LCs".format(*lc)))
+    return "\n".join(lines)